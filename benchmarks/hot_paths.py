@@ -0,0 +1,260 @@
+"""Times the render and input hot paths against the simulated hardware,
+every benchmark in a fresh interpreter. The terminal benchmark runs
+on a pseudo terminal, so it does not need a real one.
+
+    python benchmarks/hot_paths.py [--json] [--output FILE] [--repeat N] [name ...]
+
+The results file can be compared between commits, times are seconds per call.
+"""
+import argparse
+import fcntl
+import itertools
+import json
+import os
+import platform
+import pty
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import threading
+import time
+import timeit
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(REPOSITORY_DIR, 'puzzled')
+# size of the pseudo terminal, large enough for the terminal layout
+TERMINAL_SIZE = (40, 120)
+# fixed, the terminal output needs changeable colors and results should not depend on the caller
+TERMINAL_TYPE = 'xterm-256color'
+
+# name -> (setup function returning the callable to time, needs a terminal)
+BENCHMARKS = {}
+# devices of the simulated hardware, set up in the benchmark process
+hardware = None
+
+
+def benchmark(name: str, terminal: bool = False):
+    def register(setup):
+        BENCHMARKS[name] = (setup, terminal)
+        return setup
+    return register
+
+
+@benchmark('render_game_area')
+def render_game_area():
+    from puzzled_io.screen import Screen
+    screen = Screen(False, use_headless=True)
+    screen.fill_game_area(0x800000)
+
+    def run():
+        screen.background.mark_dirty()
+        screen._render_game_area()
+    return run
+
+
+@benchmark('render_game_area_text')
+def render_game_area_text():
+    from puzzled_io.screen import Screen
+    screen = Screen(False, use_headless=True)
+    screen.fill_game_area(0x800000)
+    screen.set_text('Hej')
+
+    def run():
+        screen.background.mark_dirty()
+        screen._render_game_area()
+    return run
+
+
+@benchmark('render_leds')
+def render_leds():
+    from puzzled_io.screen import Screen
+    screen = Screen(True)
+    screen.fill_game_area(0x800000)
+    screen._render_game_area()
+    return lambda: screen._render_leds(screen.frame)
+
+
+@benchmark('render_terminal', terminal=True)
+def render_terminal():
+    import numpy as np
+    from puzzled_io.const import TOTAL_AMOUNT_LEDS
+    from puzzled_io.screen import Screen
+    screen = Screen(False, True)
+    # alternate between two frames differing in every pixel, so every cell is redrawn
+    frames = np.random.default_rng(0).integers(0, 1 << 24, (2, TOTAL_AMOUNT_LEDS), dtype=np.int32)
+    frames[1] ^= 0x808080
+    counter = itertools.count()
+    return lambda: screen._render_terminal(frames[next(counter) & 1])
+
+
+def set_text(length: int):
+    from puzzled_io.font import compile_text
+    from puzzled_io.screen import Screen
+    screen = Screen(False, use_headless=True)
+    text = ('Hej Puzzled! ' * length)[:length]
+
+    def run():
+        # measure the layout, not the cache
+        compile_text.cache_clear()
+        screen.set_text(text)
+    return run
+
+
+for text_length in (1, 8, 32):
+    benchmark(f'set_text_{text_length}')(lambda length=text_length: set_text(length))
+
+
+@benchmark('find_closest_color_index')
+def find_closest_color_index():
+    from puzzled_io import helper
+    if not helper.colors:
+        helper.colors.extend(helper.create_palette())
+    return lambda: helper.find_closest_color_index(0x3f7fbf)
+
+
+@benchmark('load_glyphs')
+def load_glyphs():
+    from puzzled_io.font import load_glyphs
+    # the first call builds the atlas if needed, only the mapping is timed
+    load_glyphs()
+    return load_glyphs
+
+
+@benchmark('input_record_change')
+def input_record_change():
+    from puzzled_io.events import InputSource
+    from puzzled_io.input import Input
+    inputer = Input(callback=lambda change: None)
+    counter = itertools.count()
+
+    def run():
+        value = next(counter)
+        inputer.record_change(InputSource.pos_a, value % 23, value % 4096, time.monotonic())
+    return run
+
+
+@benchmark('input_read_inputs')
+def input_read_inputs():
+    from puzzled_io.input import Input
+    inputer = Input(callback=lambda change: None)
+    return inputer.poll_thread.read_inputs
+
+
+@benchmark('input_button_event')
+def input_button_event():
+    from puzzled_io.input import Input, BUTTON_A_CHANNEL
+    Input(callback=lambda change: None)
+    counter = itertools.count()
+    # a press or a release, with a bouncing contact
+    return lambda: hardware.gpio.set_level(BUTTON_A_CHANNEL, next(counter) & 1, bounces=2)
+
+
+def install_hardware() -> None:
+    global hardware
+    from puzzled_io import simulation
+    hardware = simulation.install(simulation.SimulatedAdc(noise=2.))
+    # only importable once the simulation is installed
+    from puzzled_io.input import POT_A_CHANNEL, POT_B_CHANNEL, BRIGHTNESS_CHANNEL
+    # keep the potentiometers moving, so every read finds changes
+    hardware.adc.waveforms.update({
+        POT_A_CHANNEL: simulation.sine(2048, 2000, 0.5),
+        POT_B_CHANNEL: simulation.sine(2048, 2000, 0.3),
+        BRIGHTNESS_CHANNEL: simulation.constant(4095),
+    })
+
+
+def measure(name: str, repeat: int, result_path: str) -> None:
+    sys.path.insert(0, PACKAGE_DIR)
+    install_hardware()
+    setup, _ = BENCHMARKS[name]
+    timer = timeit.Timer(setup())
+    number, _ = timer.autorange()
+    times = sorted(total / number for total in timer.repeat(repeat, number))
+    with open(result_path, 'w') as f:
+        json.dump({'best': times[0], 'median': times[len(times) // 2], 'calls': number * repeat}, f)
+
+
+def drain(fd: int) -> None:
+    while True:
+        try:
+            if not os.read(fd, 65536):
+                return
+        except OSError:
+            # the terminal is gone once the child exited
+            return
+
+
+def run_child(command: list[str], terminal: bool) -> None:
+    if not terminal:
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        return
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', *TERMINAL_SIZE, 0, 0))
+    environment = dict(os.environ, TERM=TERMINAL_TYPE)
+    process = subprocess.Popen(command, stdin=slave, stdout=slave, env=environment)
+    os.close(slave)
+    reader = threading.Thread(target=drain, args=(master,), daemon=True)
+    reader.start()
+    try:
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, command)
+    finally:
+        reader.join(1)
+        os.close(master)
+
+
+def run(name: str, repeat: int) -> dict:
+    _, terminal = BENCHMARKS[name]
+    with tempfile.NamedTemporaryFile(suffix='.json') as result_file:
+        run_child([sys.executable, __file__, '--repeat', str(repeat), '--child', name, result_file.name],
+                  terminal)
+        with open(result_file.name) as f:
+            return json.load(f)
+
+
+def commit() -> None | str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPOSITORY_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', metavar='name', help=f'benchmarks to run: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--json', action='store_true', help='print machine readable results')
+    parser.add_argument('--output', help='also write the machine readable results to this file')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        measure(args.child[0], args.repeat, args.child[1])
+        return
+
+    unknown = set(args.names) - BENCHMARKS.keys()
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+    names = args.names or list(BENCHMARKS)
+    report = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.time(),
+        'results': {name: run(name, args.repeat) for name in names},
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, result in report['results'].items():
+        print(f'{name:26} best {result["best"] * 1e6:9.2f} us   median {result["median"] * 1e6:9.2f} us')
+
+
+if __name__ == '__main__':
+    main()
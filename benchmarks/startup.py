@@ -0,0 +1,84 @@
+"""Measures the cold start of the screen: import time and time until the first
+frame got rendered, each in a fresh interpreter. Without rpi_ws281x the
+hardware configuration runs on the simulated LEDs, the terminal configuration
+always on a pseudo terminal.
+
+    python benchmarks/startup.py [--json] [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from hot_paths import run_child
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'puzzled')
+
+CONFIGURATIONS = {
+    'hardware': {'use_leds': True},
+    'terminal': {'use_leds': False, 'use_terminal': True},
+    'headless': {'use_leds': False, 'use_headless': True},
+}
+
+
+def measure(configuration: str, result_path: str) -> None:
+    start = time.perf_counter()
+    sys.path.insert(0, PACKAGE_DIR)
+    from puzzled_io.lazy import module_available
+    simulated = configuration == 'hardware' and not module_available('rpi_ws281x')
+    if simulated:
+        # counted as import time, it imports little more than numpy, which the screen needs anyway
+        from puzzled_io import simulation
+        simulation.install()
+    from puzzled_io.screen import Screen
+    imported = time.perf_counter()
+    screen = Screen(**CONFIGURATIONS[configuration])
+    screen.set_text('Hej')
+    screen.render()
+    first_frame = time.perf_counter()
+    with open(result_path, 'w') as f:
+        json.dump({'import': imported - start, 'first_frame': first_frame - imported, 'simulated': simulated}, f)
+
+
+def run(configuration: str, runs: int) -> dict:
+    results = []
+    for _ in range(runs):
+        with tempfile.NamedTemporaryFile(suffix='.json') as result_file:
+            run_child([sys.executable, __file__, '--child', configuration, result_file.name],
+                      configuration == 'terminal')
+            with open(result_file.name) as f:
+                results.append(json.load(f))
+    return {
+        'import': statistics.median(result['import'] for result in results),
+        'first_frame': statistics.median(result['first_frame'] for result in results),
+        'runs': runs,
+        'simulated': results[0]['simulated'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--json', action='store_true', help='print machine readable results')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        measure(*args.child)
+        return
+
+    results = {configuration: run(configuration, args.runs) for configuration in CONFIGURATIONS}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for configuration, result in results.items():
+        print(f'{configuration:10} import {result["import"] * 1000:7.1f} ms   '
+              f'first frame {result["first_frame"] * 1000:7.1f} ms'
+              f'{"   (simulated)" if result["simulated"] else ""}')
+
+
+if __name__ == '__main__':
+    main()
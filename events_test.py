@@ -0,0 +1,108 @@
+import sys
+import threading
+import time
+
+import numpy as np
+
+from puzzled.puzzled_io.events import EventQueue, InputSource, STATE_DTYPE
+
+EVENTS_PER_PRODUCER = 5000
+PRODUCER_SOURCES = (InputSource.pos_a, InputSource.pos_b)
+
+
+class BlockingRing(np.ndarray):
+    """Ring holding up the next publish until released, after the producer
+    updated the state already.
+    """
+
+    def __array_finalize__(self, obj):
+        self.publishing = getattr(obj, 'publishing', None)
+        self.release = getattr(obj, 'release', None)
+
+    def __setitem__(self, index, value):
+        self.publishing.set()
+        self.release.wait()
+        super().__setitem__(index, value)
+
+
+def run_producers(queue: EventQueue, consume) -> None:
+    """Record events from two threads while `consume` is called on this one,
+    with a tiny switch interval so the threads interleave as much as possible.
+    """
+    def produce(source: InputSource):
+        for value in range(1, EVENTS_PER_PRODUCER + 1):
+            queue.record(source, value, value * 2, float(value))
+            # give the consumer a chance to run between the events as well
+            time.sleep(0)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        producers = [threading.Thread(target=produce, args=(source,)) for source in PRODUCER_SOURCES]
+        for producer in producers:
+            producer.start()
+        while any(producer.is_alive() for producer in producers):
+            consume()
+        for producer in producers:
+            producer.join()
+        consume()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def states_after(events: np.ndarray) -> np.ndarray:
+    """State of all sources after every sequence, rebuilt from the events."""
+    states = np.zeros((len(events) + 1, len(InputSource)), STATE_DTYPE)
+    for event in events:
+        sequence = event['sequence']
+        states[sequence] = states[sequence - 1]
+        states[sequence][event['source']] = (event['value'], event['raw'], event['timestamp'])
+    return states
+
+
+def test_drain_returns_every_event_once_in_order():
+    queue = EventQueue(capacity=4 * EVENTS_PER_PRODUCER)
+    drained = []
+    run_producers(queue, lambda: drained.append(queue.drain()))
+    events = np.concatenate(drained)
+
+    assert queue.dropped == 0
+    np.testing.assert_array_equal(events['sequence'], np.arange(1, 2 * EVENTS_PER_PRODUCER + 1))
+    for source in PRODUCER_SOURCES:
+        values = events['value'][events['source'] == source]
+        np.testing.assert_array_equal(values, np.arange(1, EVENTS_PER_PRODUCER + 1))
+
+
+def test_snapshot_matches_its_sequence():
+    queue = EventQueue(capacity=4 * EVENTS_PER_PRODUCER)
+    snapshots = []
+    run_producers(queue, lambda: snapshots.append(queue.snapshot()))
+    events = queue.drain()
+    assert len(events) == 2 * EVENTS_PER_PRODUCER
+
+    states = states_after(events)
+    mismatches = [sequence for sequence, state in snapshots if not np.array_equal(state, states[sequence])]
+    assert not mismatches, f'{len(mismatches)} of {len(snapshots)} snapshots do not match their sequence'
+
+
+def test_snapshot_waits_for_a_write_in_progress():
+    queue = EventQueue()
+    queue.record(InputSource.pos_a, 1, 2, 1.)
+    ring = queue._ring.view(BlockingRing)
+    ring.publishing = threading.Event()
+    ring.release = threading.Event()
+    queue._ring = ring
+    producer = threading.Thread(target=queue.record, args=(InputSource.pos_b, 3, 4, 2.))
+    producer.start()
+    assert ring.publishing.wait(1)
+
+    snapshots = []
+    consumer = threading.Thread(target=lambda: snapshots.append(queue.snapshot()))
+    consumer.start()
+    consumer.join(0.1)
+    ring.release.set()
+    producer.join()
+    consumer.join()
+
+    sequence, state = snapshots[0]
+    np.testing.assert_array_equal(state, states_after(queue.drain())[sequence])
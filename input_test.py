@@ -0,0 +1,26 @@
+import time
+
+from puzzled.puzzled_io.events import InputSource
+from puzzled.puzzled_io.input import ButtonStateType, Input
+
+
+def test_headless_input_takes_recorded_changes():
+    inputer = Input(use_headless=True)
+    assert isinstance(inputer.poll_thread, Input.HeadlessInput)
+    inputer.start()
+    inputer.record_change(InputSource.pos_a, 3, 300, time.monotonic())
+    inputer.record_change(InputSource.button_b, ButtonStateType.pressed, 0, time.monotonic())
+
+    sequence, state = inputer.snapshot()
+    assert sequence == 2
+    assert state['pos_a'].quantized == 3
+    assert state['button_b'].type == ButtonStateType.pressed
+    inputer._cleanup()
+
+
+def test_input_without_a_terminal_is_headless():
+    # pytest replaces stdin, which is no terminal
+    inputer = Input()
+    assert inputer.use_headless
+    assert isinstance(inputer.poll_thread, Input.HeadlessInput)
+    inputer._cleanup()
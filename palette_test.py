@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+
+from puzzled.puzzled_io import helper
+from puzzled.puzzled_io.helper import build_palette_lut, colors_to_palette_indices, create_palette, \
+    find_closest_color_index, LUT_CHANNEL_BITS
+
+
+def brute_force_indices(colors_24bit: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    rgb = np.stack(((colors_24bit >> 16) & 0xFF, (colors_24bit >> 8) & 0xFF, colors_24bit & 0xFF), axis=-1)
+    distances = ((rgb[:, None, :] - palette[None, :, :]) ** 2).sum(axis=-1)
+    return np.argmin(distances, axis=1)
+
+
+def distances_to(colors_24bit: np.ndarray, palette: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    rgb = np.stack(((colors_24bit >> 16) & 0xFF, (colors_24bit >> 8) & 0xFF, colors_24bit & 0xFF), axis=-1)
+    return np.sqrt(((rgb - palette[indices]) ** 2).sum(axis=-1))
+
+
+def test_bucket_centers_match_brute_force():
+    palette = np.array(create_palette())
+    lut = build_palette_lut(create_palette())
+    step = 256 >> LUT_CHANNEL_BITS
+    centers = np.arange(1 << LUT_CHANNEL_BITS) * step + step // 2
+    red, green, blue = np.meshgrid(centers, centers, centers, indexing='ij')
+    colors_24bit = ((red << 16) | (green << 8) | blue).ravel()
+
+    np.testing.assert_array_equal(colors_to_palette_indices(colors_24bit, lut), brute_force_indices(colors_24bit, palette))
+
+
+def test_mapper_stays_within_quantization_error():
+    palette = np.array(create_palette())
+    lut = build_palette_lut(create_palette())
+    colors_24bit = np.random.default_rng(42).integers(0, 1 << 24, 20000)
+
+    mapped = distances_to(colors_24bit, palette, colors_to_palette_indices(colors_24bit, lut))
+    closest = distances_to(colors_24bit, palette, brute_force_indices(colors_24bit, palette))
+    # the lut is built from bucket centers, so the error is at most twice the distance to one
+    max_error = 2 * math.sqrt(3) * (256 >> LUT_CHANNEL_BITS) / 2
+    assert np.all(mapped <= closest + max_error)
+
+
+def test_mapper_keeps_array_shape():
+    lut = build_palette_lut(create_palette())
+    game_area = np.full((11, 23), 0xFFFFFF, np.int32)
+
+    mapped = colors_to_palette_indices(game_area, lut)
+    assert mapped.shape == game_area.shape
+    assert create_palette()[mapped[0, 0]] == max(create_palette())
+
+
+def test_find_closest_color_index_matches_brute_force(monkeypatch):
+    monkeypatch.setattr(helper, 'colors', create_palette())
+    palette = np.array(create_palette())
+    colors_24bit = np.random.default_rng(7).integers(0, 1 << 24, 200)
+
+    expected = brute_force_indices(colors_24bit, palette)
+    assert [find_closest_color_index(int(color)) for color in colors_24bit] == list(expected)
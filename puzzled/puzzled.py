@@ -1,10 +1,19 @@
+import argparse
+import atexit
 import signal
 import sys
-import time
 
+import numpy as np
+
+from puzzled_io.clock import FrameClock
+from puzzled_io.color import wheel
+from puzzled_io.helper import POINTS_HEIGHT
+from puzzled_io.correction import brightness_from_level
 from puzzled_io.input import Input, ButtonStateType
+from puzzled_io.metrics import metrics, MetricsExporter
+from puzzled_io.recording import SessionRecorder
 from puzzled_io.screen import Screen
-from puzzled_io.const import WIDTH, HEIGHT
+from puzzled_io.const import WIDTH, HEIGHT, FPS
 
 
 def signal_handler(sig, frame):
@@ -12,36 +21,18 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
-def wheel(pos) -> int:
-    """Generate rainbow colors across 0-255 positions."""
-    if pos < 85:
-        return (pos * 3 << 16) + (255 - pos * 3 << 8)
-    elif pos < 170:
-        pos -= 85
-        return (255 - pos * 3 << 16) + (pos * 3)
-    else:
-        pos -= 170
-        return (pos * 3 << 8) + (255 - pos * 3)
-
+# wheel positions of every pixel, shifted by the offset each frame
+POINTS_A_WHEEL_POSITIONS = np.arange(POINTS_HEIGHT) * 25
+POINTS_B_WHEEL_POSITIONS = np.arange(POINTS_HEIGHT) * 50
+GAME_AREA_WHEEL_POSITIONS = np.arange(HEIGHT * WIDTH).reshape((HEIGHT, WIDTH))
 
 offset = 0
 def do_wheel(screen):
     global offset
 
-    for i in range(5):
-        color = wheel((offset + i * 25) & 0xFF)
-        screen.set_point_area_pixel(False, i, color)
-
-    for i in range(5):
-        color = wheel((offset + i * 50) & 0xFF)
-        screen.set_point_area_pixel(True, i, color)
-
-    i = 0
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            color = wheel((offset + i) & 0xFF)
-            screen.set_game_area_pixel(x, y, color)
-            i += 1
+    screen.set_point_area(False, wheel(offset + POINTS_A_WHEEL_POSITIONS))
+    screen.set_point_area(True, wheel(offset + POINTS_B_WHEEL_POSITIONS))
+    screen.set_game_area(wheel(offset + GAME_AREA_WHEEL_POSITIONS))
 
     offset += 1
 
@@ -51,27 +42,77 @@ def do_fill(screen, color):
     screen.fill_game_area(color)
 
 
+class Game:
+    """Game state, advanced by one frame with every step()."""
+
+    def __init__(self, screen, inputer):
+        self.screen = screen
+        self.inputer = inputer
+        do_fill(screen, 0x800000)
+        # screen.set_text('Hej !')
+
+        self.player = screen.add_layer(1, 1)
+        self.player.fill(0x00FF00)
+        self.button_a = screen.add_layer(1, 1, offset=(0, 0))
+        self.button_a.fill(0x0000FF)
+        self.button_b = screen.add_layer(1, 1, offset=(HEIGHT - 1, WIDTH - 1))
+        self.button_b.fill(0x0000FF)
+
+    def step(self):
+        """Render one frame from the current input state and return it."""
+        # do_wheel(self.screen)
+        # do_fill(self.screen, 0x800000)
+        events = self.inputer.drain()
+        if len(events):
+            self.screen.mark_input(float(events['timestamp'].min()))
+        sequence, state = self.inputer.snapshot()
+        self.player.offset = (state['pos_b'].quantized, state['pos_a'].quantized)
+        self.button_a.visible = state['button_a'].type == ButtonStateType.pressed
+        self.button_b.visible = state['button_b'].type == ButtonStateType.pressed
+        # without the hardware there is no brightness knob, until it was read the LEDs keep their default
+        brightness = self.inputer.input_brightness
+        if self.inputer.use_hardware and brightness is not None:
+            self.screen.set_brightness(brightness_from_level(brightness))
+        self.screen.input_sequence = sequence
+        self.screen.render()
+        return self.screen.frame
+
+
+def report_latency(screen):
+    stats = screen.latency_stats()
+    if stats.count:
+        print(f'input to photon latency over {stats.count} inputs: p50 {stats.p50 * 1000:.1f} ms, '
+              f'p95 {stats.p95 * 1000:.1f} ms, p99 {stats.p99 * 1000:.1f} ms')
+
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', metavar='FILE', help='record the session into FILE, see replay.py')
+    parser.add_argument('--metrics', metavar='TARGET',
+                        help="append stage timings as JSON lines to the file TARGET or to the socket 'unix:PATH'")
+    args = parser.parse_args()
+
     signal.signal(signal.SIGINT, signal_handler)
+    # enabled before the screen, so an output process starts with metrics enabled as well
+    if args.metrics is not None:
+        metrics.enable()
+        exporter = MetricsExporter(args.metrics)
+        exporter.start()
+        atexit.register(exporter.stop)
     screen = Screen(True, False)
-    do_fill(screen, 0x800000)
     inputer = Input()
+    game = Game(screen, inputer)
+    atexit.register(report_latency, screen)
+    if args.record is not None:
+        recorder = SessionRecorder(args.record)
+        screen.recorder = inputer.recorder = recorder
+        atexit.register(recorder.close)
     inputer.start()
-    # screen.set_text('Hej !')
+    clock = FrameClock(FPS)
 
     while True:
-        # do_wheel(screen)
-        # do_fill(screen, 0x800000)
-        x = inputer.state['pos_a'].quantized
-        y = inputer.state['pos_b'].quantized
-        do_fill(screen, 0x800000)
-        screen.set_game_area_pixel(x, y, 0x00FF00)
-        if inputer.state['button_a'].type == ButtonStateType.pressed:
-            screen.set_game_area_pixel(0, 0, 0x0000FF)
-        if inputer.state['button_b'].type == ButtonStateType.pressed:
-            screen.set_game_area_pixel(WIDTH - 1, HEIGHT - 1, 0x0000FF)
-        screen.render()
-        time.sleep(1. / 30)
+        clock.tick()
+        game.step()
         # do_fill(screen, 0xff0000)
         # print(screen[0], screen[4], screen[5], screen[9], screen[10])
         # screen.render()
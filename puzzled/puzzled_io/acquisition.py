@@ -0,0 +1,131 @@
+import math
+import time
+from typing import Sequence
+
+
+# the ADC (MCP3208) needs its chip select toggled for every conversion, so all
+# channels and samples are read in one tight loop instead of one transfer
+ADC_COMMAND = 0b00000110
+# seconds over which sample and event rates are measured
+RATE_WINDOW = 1.
+
+
+class EmaFilter:
+    """Exponential moving average over the mean of each oversampled batch."""
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.value: None | float = None
+
+    def apply(self, samples: Sequence[int]) -> float:
+        mean = sum(samples) / len(samples)
+        if self.value is None:
+            self.value = mean
+        else:
+            self.value += self.alpha * (mean - self.value)
+        return self.value
+
+
+class MedianFilter:
+    """Median of each oversampled batch, drops single spikes completely."""
+
+    def apply(self, samples: Sequence[int]) -> float:
+        ordered = sorted(samples)
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            return ordered[middle]
+        return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+FILTERS = {
+    'ema': EmaFilter,
+    'median': MedianFilter,
+}
+
+
+class HysteresisQuantizer:
+    """Quantizes a value into steps, but only leaves the current step once the
+    value is further than `hysteresis` (fraction of a step) past its border.
+    Keeps noise at a step border from toggling between two steps.
+    """
+
+    def __init__(self, step_width: float, hysteresis: float):
+        self.step_width = step_width
+        self.margin = hysteresis * step_width
+        self.value = 0
+
+    def quantize(self, value: float) -> int:
+        candidate = math.floor(value / self.step_width)
+        if candidate > self.value and value < (self.value + 1) * self.step_width + self.margin:
+            return self.value
+        if candidate < self.value and value > self.value * self.step_width - self.margin:
+            return self.value
+        self.value = candidate
+        return candidate
+
+
+class RateCounter:
+    def __init__(self):
+        self.count = 0
+        self.rate = 0.
+        self.window_start = time.monotonic()
+
+    def add(self, amount: int = 1) -> None:
+        self.count += amount
+
+    def update(self, now: float) -> None:
+        elapsed = now - self.window_start
+        if elapsed >= RATE_WINDOW:
+            self.rate = self.count / elapsed
+            self.count = 0
+            self.window_start = now
+
+
+class AcquisitionStats(tuple):
+    def __new__(cls, sample_rate: float, event_rate: float):
+        return tuple.__new__(cls, (sample_rate, event_rate))
+
+    @property
+    def sample_rate(self) -> float:
+        return self[0]
+
+    @property
+    def event_rate(self) -> float:
+        return self[1]
+
+
+class Acquisition:
+    """Reads several ADC channels with oversampling, filters every channel and
+    quantizes it with hysteresis.
+    """
+
+    def __init__(self, spi, channels: Sequence[int], step_widths: Sequence[float], oversampling: int = 4,
+                 filter_type: str = 'ema', hysteresis: float = 0.25):
+        self.spi = spi
+        self.channels = channels
+        self.oversampling = oversampling
+        self.commands = [[ADC_COMMAND, channel << 6, 0] for channel in channels]
+        self.filters = [FILTERS[filter_type]() for _ in channels]
+        self.quantizers = [HysteresisQuantizer(step_width, hysteresis) for step_width in step_widths]
+        self.samples = RateCounter()
+        self.events = RateCounter()
+
+    def read(self) -> list[tuple[int, int]]:
+        """Return (quantized, filtered raw) for every channel."""
+        xfer2 = self.spi.xfer2
+        oversampling = range(self.oversampling)
+        result = []
+        for command, input_filter, quantizer in zip(self.commands, self.filters, self.quantizers):
+            samples = []
+            for _ in oversampling:
+                reply_bytes = xfer2(command)
+                samples.append(((reply_bytes[1] & 15) << 8) + reply_bytes[2])
+            value = input_filter.apply(samples)
+            result.append((quantizer.quantize(value), round(value)))
+        self.samples.add(len(self.commands) * self.oversampling)
+        self.samples.update(time.monotonic())
+        return result
+
+    def stats(self) -> AcquisitionStats:
+        self.events.update(time.monotonic())
+        return AcquisitionStats(self.samples.rate, self.events.rate)
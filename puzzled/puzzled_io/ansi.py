@@ -0,0 +1,100 @@
+import os
+import shutil
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+from .const import HEIGHT, WIDTH, NUM_PIXELS_POINTS
+from .helper import POINTS_HEIGHT, POINTS_WIDTH, color24_to_rgb
+
+
+CELL = '██'.encode()
+# amount of terminal columns used for a single pixel
+CELL_WIDTH = 2
+RESET = b'\x1b[0m'
+HIDE_CURSOR = b'\x1b[?25l'
+SHOW_CURSOR = b'\x1b[?25h'
+CLEAR = b'\x1b[2J'
+# distance between the point areas and the game area in columns
+AREA_GAP = 5
+
+
+@lru_cache(maxsize=1024)
+def color_fragment(color: int) -> bytes:
+    """Escape sequence switching the foreground to the given 24-bit color."""
+    return b'\x1b[38;2;%d;%d;%dm' % color24_to_rgb(color)
+
+
+def move_to(row: int, column: int) -> bytes:
+    return b'\x1b[%d;%dH' % (row + 1, column + 1)
+
+
+class AnsiTerminal:
+    """Renders the game and point areas with 24-bit ANSI escape sequences and
+    pushes every frame to the terminal with a single write.
+    """
+
+    def __init__(self, fd: int = None):
+        self.fd = sys.stdout.fileno() if fd is None else fd
+        columns, lines = shutil.get_terminal_size()
+        points_width = POINTS_WIDTH * CELL_WIDTH + 2
+        game_width = WIDTH * CELL_WIDTH + 2
+        total_width = 2 * (points_width + AREA_GAP) + game_width
+        self.origin_y = max(0, (lines - HEIGHT - 2) // 2)
+        self.origin_x = max(0, (columns - total_width) // 2)
+        self.points_a_x = self.origin_x
+        self.game_x = self.points_a_x + points_width + AREA_GAP
+        self.points_b_x = self.game_x + game_width + AREA_GAP
+        self.points_y = self.origin_y + (HEIGHT - POINTS_HEIGHT) // 2
+        self.borders = b''.join((
+            self._border(self.origin_y, self.game_x, HEIGHT, WIDTH),
+            self._border(self.points_y, self.points_a_x, POINTS_HEIGHT, POINTS_WIDTH),
+            self._border(self.points_y, self.points_b_x, POINTS_HEIGHT, POINTS_WIDTH),
+        ))
+        self._write(HIDE_CURSOR + CLEAR)
+
+    def _write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+
+    @staticmethod
+    def _border(pos_y: int, pos_x: int, height: int, width: int) -> bytes:
+        inner = '─' * (width * CELL_WIDTH)
+        parts = [RESET, move_to(pos_y, pos_x), ('┌' + inner + '┐').encode()]
+        for y in range(height):
+            parts.append(move_to(pos_y + y + 1, pos_x))
+            parts.append('│'.encode())
+            parts.append(move_to(pos_y + y + 1, pos_x + width * CELL_WIDTH + 1))
+            parts.append('│'.encode())
+        parts.append(move_to(pos_y + height + 1, pos_x))
+        parts.append(('└' + inner + '┘').encode())
+        return b''.join(parts)
+
+    @staticmethod
+    def _area(parts: list, area: np.ndarray, pos_y: int, pos_x: int):
+        last_color = None
+        for y, row in enumerate(area.tolist()):
+            parts.append(move_to(pos_y + y + 1, pos_x + 1))
+            for color in row:
+                # only switch color when it differs from the cell before
+                if color != last_color:
+                    parts.append(color_fragment(color))
+                    last_color = color
+                parts.append(CELL)
+
+    def render(self, frame: np.ndarray):
+        """Draw a frame made of both point areas followed by the game area."""
+        points = frame[:NUM_PIXELS_POINTS].reshape((2, POINTS_HEIGHT))
+        game_area = frame[NUM_PIXELS_POINTS:].reshape((HEIGHT, WIDTH))
+        parts = [self.borders]
+        self._area(parts, game_area, self.origin_y, self.game_x)
+        self._area(parts, points[0].reshape(POINTS_HEIGHT, POINTS_WIDTH), self.points_y, self.points_a_x)
+        self._area(parts, points[1].reshape(POINTS_HEIGHT, POINTS_WIDTH), self.points_y, self.points_b_x)
+        parts.append(RESET)
+        self._write(b''.join(parts))
+
+    def cleanup(self):
+        self._write(RESET + SHOW_CURSOR + move_to(self.origin_y + HEIGHT + 2, 0))
@@ -0,0 +1,114 @@
+import time
+from enum import IntEnum
+
+import numpy as np
+
+from .const import FPS
+from .metrics import metrics
+
+
+# amount of frames the rolling statistics are computed over
+STATS_WINDOW = 300
+
+
+class LatePolicy(IntEnum):
+    # drop the missed frames and continue with the next one on schedule
+    skip = 0
+    # run an extra fixed time step update for every missed frame
+    catch_up = 1
+
+
+class FrameStats(tuple):
+    def __new__(cls, fps: float, jitter: float, late_frames: int, skipped_frames: int,
+                p50: float, p95: float, p99: float):
+        return tuple.__new__(cls, (fps, jitter, late_frames, skipped_frames, p50, p95, p99))
+
+    @property
+    def fps(self) -> float:
+        return self[0]
+
+    @property
+    def jitter(self) -> float:
+        return self[1]
+
+    @property
+    def late_frames(self) -> int:
+        return self[2]
+
+    @property
+    def skipped_frames(self) -> int:
+        return self[3]
+
+    @property
+    def p50(self) -> float:
+        return self[4]
+
+    @property
+    def p95(self) -> float:
+        return self[5]
+
+    @property
+    def p99(self) -> float:
+        return self[6]
+
+
+class FrameClock:
+    """Paces a loop to a fixed frame rate on the monotonic clock. The time
+    spent between two ticks is taken into account, so the frame rate does not
+    drift with the amount of work done per frame.
+    """
+
+    def __init__(self, fps: float = FPS, policy: LatePolicy = LatePolicy.skip, max_catch_up: int = 5):
+        self.frame_time = 1. / fps
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.next_frame: None | float = None
+        self.last_tick: None | float = None
+        self.late_frames = 0
+        self.skipped_frames = 0
+        self._frame_times = np.zeros(STATS_WINDOW, np.float64)
+        self._frame_count = 0
+
+    def tick(self) -> int:
+        """Wait until the next frame is due. Returns the amount of fixed time
+        step updates the caller should run for this frame.
+        """
+        now = time.monotonic()
+        if self.next_frame is None:
+            self.next_frame = now + self.frame_time
+            self.last_tick = now
+            return 1
+        remaining = self.next_frame - now
+        if remaining > 0:
+            time.sleep(remaining)
+            now = time.monotonic()
+        else:
+            self.late_frames += 1
+
+        missed = int((now - self.next_frame) / self.frame_time)
+        updates = 1
+        if self.policy == LatePolicy.catch_up:
+            updates += min(missed, self.max_catch_up)
+        self.skipped_frames += missed - (updates - 1)
+        metrics.count('frames_skipped', missed - (updates - 1))
+        self.next_frame += (missed + 1) * self.frame_time
+
+        self._frame_times[self._frame_count % STATS_WINDOW] = now - self.last_tick
+        self._frame_count += 1
+        self.last_tick = now
+        return updates
+
+    def stats(self) -> FrameStats:
+        frame_times = self._frame_times[:min(self._frame_count, STATS_WINDOW)]
+        if len(frame_times) == 0:
+            return FrameStats(0., 0., self.late_frames, self.skipped_frames, 0., 0., 0.)
+        p50, p95, p99 = np.percentile(frame_times, (50, 95, 99))
+        return FrameStats(
+            float(1. / frame_times.mean()),
+            float(frame_times.std()),
+            self.late_frames,
+            self.skipped_frames,
+            float(p50),
+            float(p95),
+            float(p99),
+        )
@@ -0,0 +1,78 @@
+import numpy as np
+import numpy.typing as npt
+
+
+WHEEL_SIZE = 256
+
+
+def split_channels(colors: npt.ArrayLike) -> tuple[npt.NDArray[np.int32], npt.NDArray[np.int32], npt.NDArray[np.int32]]:
+    """Split packed 24-bit colors into red, green and blue arrays."""
+    colors = np.asarray(colors, np.int32)
+    return (colors >> 16) & 0xFF, (colors >> 8) & 0xFF, colors & 0xFF
+
+
+def pack_channels(red: npt.ArrayLike, green: npt.ArrayLike, blue: npt.ArrayLike) -> npt.NDArray[np.int32]:
+    """Pack channel arrays into 24-bit colors, values outside 0-255 are clipped."""
+    red, green, blue = (np.clip(channel, 0, 255).astype(np.int32) for channel in (red, green, blue))
+    return (red << 16) | (green << 8) | blue
+
+
+def build_wheel_lut() -> npt.NDArray[np.int32]:
+    """Rainbow colors across 0-255 positions: red to green to blue and back."""
+    pos = np.arange(WHEEL_SIZE, dtype=np.int32)
+    sector = np.minimum(pos // 85, 2)
+    rising = (pos - sector * 85) * 3
+    falling = 255 - rising
+    zeros = np.zeros(WHEEL_SIZE, np.int32)
+    red = np.choose(sector, (rising, falling, zeros))
+    green = np.choose(sector, (falling, zeros, rising))
+    blue = np.choose(sector, (zeros, rising, falling))
+    return pack_channels(red, green, blue)
+
+
+WHEEL_LUT = build_wheel_lut()
+WHEEL_LUT.flags.writeable = False
+
+
+def wheel(positions: npt.ArrayLike) -> npt.NDArray[np.int32]:
+    """Look up the rainbow color of every position, positions wrap at 256."""
+    return WHEEL_LUT[np.asarray(positions) & 0xFF]
+
+
+def blend_colors(below: npt.ArrayLike, above: npt.ArrayLike,
+                 alpha: int | npt.NDArray[np.int32]) -> npt.NDArray[np.int32]:
+    """Blend `above` over `below` with an alpha of 0-255, scalar or per pixel."""
+    alpha = np.asarray(alpha, np.int32)
+    return pack_channels(*((channel_above * alpha + channel_below * (255 - alpha)) // 255
+                           for channel_below, channel_above in zip(split_channels(below), split_channels(above))))
+
+
+def lerp(start: npt.ArrayLike, end: npt.ArrayLike, t: float | npt.NDArray[np.float64]) -> npt.NDArray[np.int32]:
+    """Interpolate between two colors or frames, t runs from 0 (start) to 1 (end)."""
+    alpha = np.rint(np.clip(t, 0., 1.) * 255).astype(np.int32)
+    return blend_colors(start, end, alpha)
+
+
+def gradient(start: int, end: int, length: int) -> npt.NDArray[np.int32]:
+    """A row of `length` colors running from `start` to `end`."""
+    return lerp(start, end, np.linspace(0., 1., length))
+
+
+def gradient_area(start: int, end: int, shape: tuple[int, int], axis: int = 1) -> npt.NDArray[np.int32]:
+    """Fill an area of `shape` with a gradient, along the rows for axis 1 and
+    along the columns for axis 0.
+    """
+    row = gradient(start, end, shape[axis])
+    if axis == 0:
+        row = row[:, np.newaxis]
+    return np.broadcast_to(row, shape).copy()
+
+
+def fade_to(frame: npt.NDArray[np.int32], color: int, t: float,
+            out: None | npt.NDArray[np.int32] = None) -> npt.NDArray[np.int32]:
+    """Fade a frame towards a single color, t runs from 0 (frame) to 1 (color)."""
+    faded = lerp(frame, color, t)
+    if out is None:
+        return faded
+    np.copyto(out, faded)
+    return out
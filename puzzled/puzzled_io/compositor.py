@@ -0,0 +1,152 @@
+import numpy as np
+import numpy.typing as npt
+
+from .color import blend_colors
+from .const import HEIGHT, WIDTH
+
+
+class Layer:
+    """A rectangle of packed 24-bit colors placed at `offset` (y, x) in the
+    game area. An optional boolean `mask` limits which pixels are drawn, an
+    optional `alpha` (0-255, scalar or per pixel) blends them with the layers
+    below.
+
+    Changing a layer through its methods marks it dirty; after writing into
+    `pixels` directly call `mark_dirty()`.
+    """
+
+    def __init__(self, height: int, width: int, z: int = 0, offset: tuple[int, int] = (0, 0),
+                 visible: bool = True, pixels: None | npt.NDArray[np.int32] = None):
+        self.pixels = np.zeros((height, width), np.int32) if pixels is None else pixels
+        self.z = z
+        self._offset = offset
+        self._visible = visible
+        self._mask: None | npt.NDArray[np.bool_] = None
+        self._alpha: None | int | npt.NDArray[np.uint8] = None
+        self.dirty = True
+        # composition of all layers below this one, lets the compositor skip them
+        self.below = np.zeros((HEIGHT, WIDTH), np.int32)
+        self.below_valid = False
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+
+    @property
+    def offset(self) -> tuple[int, int]:
+        return self._offset
+
+    @offset.setter
+    def offset(self, offset: tuple[int, int]) -> None:
+        if offset != self._offset:
+            self._offset = offset
+            self.dirty = True
+
+    @property
+    def visible(self) -> bool:
+        return self._visible
+
+    @visible.setter
+    def visible(self, visible: bool) -> None:
+        if visible != self._visible:
+            self._visible = visible
+            self.dirty = True
+
+    @property
+    def mask(self) -> None | npt.NDArray[np.bool_]:
+        return self._mask
+
+    @mask.setter
+    def mask(self, mask: None | npt.NDArray[np.bool_]) -> None:
+        self._mask = mask
+        self.dirty = True
+
+    @property
+    def alpha(self) -> None | int | npt.NDArray[np.uint8]:
+        return self._alpha
+
+    @alpha.setter
+    def alpha(self, alpha: None | int | npt.NDArray[np.uint8]) -> None:
+        self._alpha = alpha
+        self.dirty = True
+
+    def fill(self, color: int) -> None:
+        self.pixels.fill(color)
+        self.dirty = True
+
+    def set_pixel(self, x: int, y: int, color: int) -> None:
+        self.pixels[y][x] = color
+        self.dirty = True
+
+    def resize(self, height: int, width: int, color: int = 0) -> None:
+        self.pixels = np.full((height, width), color, np.int32)
+        self.dirty = True
+
+    def draw(self, output: npt.NDArray[np.int32]) -> None:
+        pos_y, pos_x = self._offset
+        height, width = self.pixels.shape
+        # clip the layer to the output
+        top, left = max(pos_y, 0), max(pos_x, 0)
+        bottom, right = min(pos_y + height, output.shape[0]), min(pos_x + width, output.shape[1])
+        if top >= bottom or left >= right:
+            return
+        target = output[top:bottom, left:right]
+        source_area = (slice(top - pos_y, bottom - pos_y), slice(left - pos_x, right - pos_x))
+        source = self.pixels[source_area]
+        mask = None if self._mask is None else self._mask[source_area]
+
+        if self._alpha is not None:
+            alpha = self._alpha if np.isscalar(self._alpha) else self._alpha[source_area].astype(np.int32)
+            source = blend_colors(target, source, alpha)
+        if mask is None:
+            np.copyto(target, source)
+        else:
+            np.copyto(target, source, where=mask)
+
+
+class Compositor:
+    """Composes z-ordered layers into one preallocated output buffer. Layers
+    below the lowest dirty layer are not drawn again, their composition is
+    taken from the cache of that layer.
+    """
+
+    def __init__(self, output: None | npt.NDArray[np.int32] = None):
+        self.layers: list[Layer] = []
+        self.output = np.zeros((HEIGHT, WIDTH), np.int32) if output is None else output
+
+    def add_layer(self, layer: Layer) -> Layer:
+        self.layers.append(layer)
+        # stable, so layers with the same z keep the order they were added in
+        self.layers.sort(key=lambda entry: entry.z)
+        layer.dirty = True
+        layer.below_valid = False
+        return layer
+
+    def remove_layer(self, layer: Layer) -> None:
+        index = self.layers.index(layer)
+        self.layers.pop(index)
+        if index < len(self.layers):
+            self.layers[index].dirty = True
+            self.layers[index].below_valid = False
+        elif self.layers:
+            self.layers[-1].dirty = True
+        else:
+            self.output.fill(0)
+
+    def compose(self) -> npt.NDArray[np.int32]:
+        start = next((index for index, layer in enumerate(self.layers) if layer.dirty), None)
+        if start is None:
+            return self.output
+        # new layers, or ones right above a removed layer, have no valid cache yet
+        while start > 0 and not self.layers[start].below_valid:
+            start -= 1
+        if start == 0:
+            self.output.fill(0)
+        else:
+            np.copyto(self.output, self.layers[start].below)
+        for layer in self.layers[start:]:
+            np.copyto(layer.below, self.output)
+            layer.below_valid = True
+            if layer.visible:
+                layer.draw(self.output)
+            layer.dirty = False
+        return self.output
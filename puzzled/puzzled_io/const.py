@@ -3,6 +3,22 @@ WIDTH = 23
 HEIGHT = 11
 NUM_PIXELS = 253
 NUM_PIXELS_POINTS = 10
+TOTAL_AMOUNT_LEDS = NUM_PIXELS + NUM_PIXELS_POINTS
 POLL_RATE = 1000
+# poll rate once the inputs did not change for IDLE_TIMEOUT seconds
+IDLE_POLL_RATE = 50
+IDLE_TIMEOUT = 2.
+# longer than the usual keyboard auto repeat delays (X11 660 ms, GNOME 500 ms), so a held key stays pressed
+KEY_RELEASE_TIMEOUT = 0.75
+FPS = 30
 BRIGHTNESS_LEVELS = 127
+# gamma of the LEDs, applied together with the brightness in the output stage
+GAMMA = 2.2
+# brightness of the LEDs from 0 to 255 until the brightness knob was read, low to keep the current down
+DEFAULT_BRIGHTNESS = 10
 POTENTIOMETER_MAX_VALUE = 4098
+# ADC readings per channel and poll, filtered by INPUT_FILTER ('ema' or 'median')
+OVERSAMPLING = 4
+INPUT_FILTER = 'ema'
+# fraction of a step a potentiometer has to move past a step border to change
+HYSTERESIS = 0.25
@@ -0,0 +1,67 @@
+from typing import Callable
+
+import numpy as np
+import numpy.typing as npt
+
+from .color import split_channels
+from .const import BRIGHTNESS_LEVELS, GAMMA
+
+MAX_BRIGHTNESS = 255
+
+CHANNEL_VALUES = np.arange(256, dtype=np.float64)
+
+
+def brightness_from_level(level: int) -> int:
+    """Map a quantized brightness knob level to a brightness of 0-255."""
+    level = min(max(level, 0), BRIGHTNESS_LEVELS - 1)
+    return level * MAX_BRIGHTNESS // (BRIGHTNESS_LEVELS - 1)
+
+
+def build_led_lut(brightness: int, gamma: float = GAMMA) -> npt.NDArray[np.int32]:
+    """LEDs are linear, so the colors are gamma corrected before they are
+    scaled by the brightness.
+    """
+    lut = 255 * (CHANNEL_VALUES / 255) ** gamma * (brightness / MAX_BRIGHTNESS)
+    return np.rint(lut).astype(np.int32)
+
+
+def build_display_lut(brightness: int, gamma: float = GAMMA) -> npt.NDArray[np.int32]:
+    """Displays apply the gamma themselves, the brightness is scaled so it is
+    perceived like the same brightness on the LEDs.
+    """
+    lut = CHANNEL_VALUES * (brightness / MAX_BRIGHTNESS) ** (1 / gamma)
+    return np.rint(lut).astype(np.int32)
+
+
+class ColorCorrection:
+    """Applies a per channel lookup table to whole frames. The table is only
+    rebuilt when the brightness changes.
+    """
+
+    def __init__(self, lut_builder: Callable[[int, float], npt.NDArray[np.int32]], gamma: float = GAMMA,
+                 brightness: int = MAX_BRIGHTNESS):
+        self.lut_builder = lut_builder
+        self.gamma = gamma
+        self.brightness: None | int = None
+        self.lut: None | npt.NDArray[np.int32] = None
+        self.identity = False
+        self.set_brightness(brightness)
+
+    def set_brightness(self, brightness: int) -> bool:
+        """Returns whether the lookup table had to be rebuilt."""
+        brightness = min(max(int(brightness), 0), MAX_BRIGHTNESS)
+        if brightness == self.brightness:
+            return False
+        lut = self.lut_builder(brightness, self.gamma)
+        # replaced as a whole, so a render thread never sees a half built table
+        self.identity = bool(np.array_equal(lut, CHANNEL_VALUES))
+        self.lut = lut
+        self.brightness = brightness
+        return True
+
+    def apply(self, frame: npt.NDArray[np.int32]) -> npt.NDArray[np.int32]:
+        if self.identity:
+            return frame
+        lut = self.lut
+        red, green, blue = split_channels(frame)
+        return (lut[red] << 16) | (lut[green] << 8) | lut[blue]
@@ -0,0 +1,105 @@
+import threading
+import time
+from enum import IntEnum
+
+import numpy as np
+
+
+# amount of events kept until the consumer drains them
+EVENT_QUEUE_CAPACITY = 256
+
+EVENT_DTYPE = np.dtype([
+    ('sequence', np.int64),
+    ('source', np.uint8),
+    ('value', np.int32),
+    ('raw', np.int32),
+    ('timestamp', np.float64),
+])
+STATE_DTYPE = np.dtype([
+    ('value', np.int32),
+    ('raw', np.int32),
+    ('timestamp', np.float64),
+])
+
+
+class InputSource(IntEnum):
+    pos_a = 0
+    pos_b = 1
+    button_a = 2
+    button_b = 3
+    brightness = 4
+
+
+class EventQueue:
+    """Bounded ring buffer of input events, written by the poller threads and
+    drained once per frame by the game loop.
+
+    Producers serialize on a lock, which keeps the sequence numbers in the
+    order the records are published. Each record is tagged with its sequence
+    number. drain() and snapshot() take no lock: the consumer only takes
+    records whose sequence matches the one it expects, so it never sees
+    overwritten slots. When the consumer falls behind more than the capacity
+    the oldest events are dropped.
+
+    The state of all sources works like a sequence lock: producers keep the
+    version odd while updating the state and publishing the event,
+    snapshot() retries until it copied the state with the same even version
+    before and after.
+    """
+
+    def __init__(self, capacity: int = EVENT_QUEUE_CAPACITY):
+        self.capacity = capacity
+        self._ring = np.zeros(capacity, EVENT_DTYPE)
+        self._read_sequence = 0
+        self.dropped = 0
+        # latest value for every source, so a consumer can sample the state
+        self._state = np.zeros(len(InputSource), STATE_DTYPE)
+        self._write_lock = threading.Lock()
+        # odd while a producer is writing, see snapshot()
+        self._version = 0
+        # sequence of the latest published event, the state contains all up to it
+        self._sequence = 0
+
+    def record(self, source: InputSource, value: int, raw: int, timestamp: float) -> int:
+        """Publish an event and return its sequence number."""
+        with self._write_lock:
+            sequence = self._sequence + 1
+            self._version += 1
+            self._state[source] = (value, raw, timestamp)
+            self._ring[(sequence - 1) % self.capacity] = (sequence, source, value, raw, timestamp)
+            self._sequence = sequence
+            self._version += 1
+        return sequence
+
+    def latest_sequence(self) -> int:
+        return self._sequence
+
+    def drain(self) -> np.ndarray:
+        """Return all events published since the last drain (non-blocking)."""
+        newest = self.latest_sequence()
+        if newest - self._read_sequence > self.capacity:
+            self.dropped += newest - self.capacity - self._read_sequence
+            self._read_sequence = newest - self.capacity
+        expected = np.arange(self._read_sequence + 1, newest + 1)
+        events = self._ring[(expected - 1) % self.capacity]
+        # stop at the first slot producers overwrote while it was being read
+        overwritten = np.flatnonzero(events['sequence'] != expected)
+        if len(overwritten):
+            events = events[:overwritten[0]]
+        self._read_sequence += len(events)
+        return events
+
+    def snapshot(self) -> tuple[int, np.ndarray]:
+        """Return a consistent copy of the latest state of all sources together
+        with the sequence number it corresponds to.
+        """
+        while True:
+            version = self._version
+            if version & 1:
+                # let the producer finish
+                time.sleep(0)
+                continue
+            sequence = self._sequence
+            state = self._state.copy()
+            if self._version == version:
+                return sequence, state
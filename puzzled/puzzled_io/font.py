@@ -1,7 +1,13 @@
+import hashlib
 import os
+from enum import IntEnum
+from functools import lru_cache
+
 import numpy as np
 import numpy.typing as npt
 
+from .const import HEIGHT
+
 
 # font used:
 # https://www.1001fonts.com/subway-ticker-font.html
@@ -9,6 +15,25 @@ import numpy.typing as npt
 GLYPH_HEIGHT = 7
 GLYPH_ENTRY_HEIGHT = GLYPH_HEIGHT + 1
 GLYPH_FILE = os.path.join(os.path.dirname(__file__), 'glyphs.txt')
+# binary sidecar of GLYPH_FILE, rebuilt whenever the hash of GLYPH_FILE changes
+ATLAS_FILE = os.path.join(os.path.dirname(__file__), 'glyphs.atlas')
+ATLAS_MAGIC = b'PZGA'
+ATLAS_VERSION = 1
+# amount of compiled text masks kept around
+TEXT_MASK_CACHE_SIZE = 64
+ATLAS_HEADER = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u4'),
+    ('hash', 'S32'),
+    ('count', '<u4'),
+    ('width', '<u4'),
+])
+
+
+class VerticalAlignment(IntEnum):
+    top = 0
+    center = 1
+    bottom = 2
 
 
 def divide_chunks(unchunked_list: list, chunk_size: int) -> list[list]:
@@ -33,19 +58,120 @@ def rehydrate_glyph(lines: list[str]) -> npt.NDArray[np.bool_]:
     return np.array(glyph, dtype=bool)
 
 
+def parse_glyph_file(lines: list[str]) -> list[tuple[str, npt.NDArray[np.bool_]]]:
+    if len(lines) % GLYPH_ENTRY_HEIGHT != 1:
+        raise Exception('file is not dividable by 8 with remainder 1\n(first line is space-width; followed by 1 line for character + 7 lines for actual glyph for each char)')
+    glyphs = [(' ', np.full((GLYPH_HEIGHT, int(lines[0])), False))]
+    for entry in divide_chunks(lines[1:], GLYPH_ENTRY_HEIGHT):
+        glyphs.append((entry[0].rstrip('\n'), rehydrate_glyph(entry[1:])))
+    return glyphs
+
+
+def build_atlas(content: bytes) -> bytes:
+    """Pack all glyphs side by side into one byte per pixel array, preceded by
+    a header and the code point, offset and width table of every character.
+    """
+    glyphs = parse_glyph_file(content.decode().splitlines(keepends=True))
+    chars, offsets, widths = [], [], []
+    offset = 0
+    for glyph_chars, glyph in glyphs:
+        for char in glyph_chars:
+            chars.append(ord(char))
+            offsets.append(offset)
+            widths.append(glyph.shape[1])
+        offset += glyph.shape[1]
+    atlas = np.concatenate([glyph for _, glyph in glyphs], axis=1).astype(np.uint8)
+
+    header = np.zeros(1, ATLAS_HEADER)
+    header[0] = (ATLAS_MAGIC, ATLAS_VERSION, hashlib.sha256(content).digest(), len(chars), atlas.shape[1])
+    tables = np.array([chars, offsets, widths], dtype='<u4')
+    return header.tobytes() + tables.tobytes() + atlas.tobytes()
+
+
+def read_atlas(data: npt.NDArray[np.uint8], content_hash: bytes) -> None | dict[str, npt.NDArray[np.bool_]]:
+    if len(data) < ATLAS_HEADER.itemsize:
+        return None
+    header = data[:ATLAS_HEADER.itemsize].view(ATLAS_HEADER)[0]
+    if header['magic'] != ATLAS_MAGIC or header['version'] != ATLAS_VERSION or header['hash'] != content_hash:
+        return None
+    count = int(header['count'])
+    width = int(header['width'])
+    tables_end = ATLAS_HEADER.itemsize + 3 * count * 4
+    if len(data) != tables_end + GLYPH_HEIGHT * width:
+        return None
+    chars, offsets, widths = data[ATLAS_HEADER.itemsize:tables_end].view('<u4').reshape(3, count)
+    atlas = data[tables_end:].reshape(GLYPH_HEIGHT, width).view(np.bool_)
+    return {chr(char): atlas[:, offset:offset + glyph_width]
+            for char, offset, glyph_width in zip(chars.tolist(), offsets.tolist(), widths.tolist())}
+
+
+def write_atlas(atlas: bytes) -> bool:
+    temp_file = f'{ATLAS_FILE}.{os.getpid()}.tmp'
+    try:
+        with open(temp_file, 'wb') as f:
+            f.write(atlas)
+        os.replace(temp_file, ATLAS_FILE)
+        return True
+    except OSError:
+        # e.g. installed read-only, just keep it in memory then
+        return False
+
+
 def load_glyphs() -> dict[str, npt.NDArray[np.bool_]]:
-    hydrated_glyphs = {}
-    with open(GLYPH_FILE) as f:
-        lines = f.readlines()
-        if len(lines) % GLYPH_ENTRY_HEIGHT != 1:
-            raise Exception('file is not dividable by 8 with remainder 1\n(first line is space-width; followed by 1 line for character + 7 lines for actual glyph for each char)')
-        hydrated_glyphs[' '] = np.full((GLYPH_HEIGHT, int(lines[0])), False)
-        glyph_entries = divide_chunks(lines[1:], GLYPH_ENTRY_HEIGHT)
-        for entry in glyph_entries:
-            glyph = rehydrate_glyph(entry[1:])
-            for char in entry[0]:
-                hydrated_glyphs[char] = glyph
-    return hydrated_glyphs
-
-
-GLYPHS = load_glyphs()
+    """Return every glyph as a read-only view into the glyph atlas. The atlas
+    sidecar is memory mapped and only rebuilt if GLYPH_FILE changed.
+    """
+    with open(GLYPH_FILE, 'rb') as f:
+        content = f.read()
+    content_hash = hashlib.sha256(content).digest()
+    if os.path.exists(ATLAS_FILE) and os.path.getsize(ATLAS_FILE) > 0:
+        glyphs = read_atlas(np.memmap(ATLAS_FILE, dtype=np.uint8, mode='r'), content_hash)
+        if glyphs is not None:
+            return glyphs
+    atlas = build_atlas(content)
+    if write_atlas(atlas):
+        return read_atlas(np.memmap(ATLAS_FILE, dtype=np.uint8, mode='r'), content_hash)
+    return read_atlas(np.frombuffer(atlas, dtype=np.uint8), content_hash)
+
+
+_glyphs: None | dict[str, npt.NDArray[np.bool_]] = None
+
+
+def get_glyphs() -> dict[str, npt.NDArray[np.bool_]]:
+    global _glyphs
+    if _glyphs is None:
+        _glyphs = load_glyphs()
+    return _glyphs
+
+
+@lru_cache(maxsize=TEXT_MASK_CACHE_SIZE)
+def compile_text(text: str, kerning: int = 1,
+                 vertical_alignment: VerticalAlignment = VerticalAlignment.center) -> npt.NDArray[np.bool_]:
+    """Lay out `text` into a read-only mask as high as the game area. The
+    result is cached, so recurring texts are only laid out once.
+    """
+    glyph_map = get_glyphs()
+    glyphs = [glyph_map[char] for char in text]
+    width = sum(glyph.shape[1] for glyph in glyphs) + kerning * max(len(glyphs) - 1, 0)
+    if vertical_alignment == VerticalAlignment.top:
+        top = 0
+    elif vertical_alignment == VerticalAlignment.bottom:
+        top = HEIGHT - GLYPH_HEIGHT
+    else:
+        top = (HEIGHT - GLYPH_HEIGHT) // 2
+
+    mask = np.zeros((HEIGHT, width), dtype=bool)
+    pos_x = 0
+    for glyph in glyphs:
+        glyph_width = glyph.shape[1]
+        mask[top:top + GLYPH_HEIGHT, pos_x:pos_x + glyph_width] = glyph
+        pos_x += glyph_width + kerning
+    mask.flags.writeable = False
+    return mask
+
+
+def __getattr__(name: str):
+    # GLYPHS used to be loaded on import, keep it available but load it lazily
+    if name == 'GLYPHS':
+        return get_glyphs()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
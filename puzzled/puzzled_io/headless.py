@@ -0,0 +1,59 @@
+import hashlib
+
+import numpy as np
+import numpy.typing as npt
+
+from .const import TOTAL_AMOUNT_LEDS
+
+# amount of frames kept by the headless output
+HEADLESS_HISTORY = 64
+FRAME_HASH_SIZE = 16
+
+
+def hash_frame(frame: npt.ArrayLike) -> str:
+    """Hex digest of a frame, stable across runs and machines."""
+    data = np.ascontiguousarray(frame, dtype='<i4').tobytes()
+    return hashlib.blake2b(data, digest_size=FRAME_HASH_SIZE).hexdigest()
+
+
+class HeadlessOutput:
+    """Output that keeps the most recent frames in memory instead of showing
+    them, for tests, simulations and benchmarks. Frames are stored as
+    composed, before any color correction.
+    """
+
+    def __init__(self, history: int = HEADLESS_HISTORY, hash_frames: bool = False):
+        self.history = history
+        self.hash_frames = hash_frames
+        self.frames = np.zeros((history, TOTAL_AMOUNT_LEDS), np.int32)
+        self.hashes: list[None | str] = [None] * history
+        self.frame_count = 0
+
+    def push(self, frame: npt.NDArray[np.int32]) -> None:
+        index = self.frame_count % self.history
+        np.copyto(self.frames[index], frame)
+        if self.hash_frames:
+            self.hashes[index] = hash_frame(frame)
+        self.frame_count += 1
+
+    def _index(self, age: int) -> int:
+        if not 0 <= age < min(self.frame_count, self.history):
+            raise IndexError(f'no frame {age} frames ago')
+        return (self.frame_count - 1 - age) % self.history
+
+    def last_frame(self, age: int = 0) -> npt.NDArray[np.int32]:
+        """The frame pushed `age` frames before the latest one."""
+        return self.frames[self._index(age)]
+
+    def last_hash(self, age: int = 0) -> None | str:
+        return self.hashes[self._index(age)]
+
+    def recent_frames(self) -> npt.NDArray[np.int32]:
+        """Copy of all kept frames, oldest first."""
+        count = min(self.frame_count, self.history)
+        indices = np.arange(self.frame_count - count, self.frame_count) % self.history
+        return self.frames[indices]
+
+    def clear(self) -> None:
+        self.frame_count = 0
+        self.hashes = [None] * self.history
@@ -2,14 +2,20 @@ import atexit
 import curses
 from typing import Optional
 
-from .const import HEIGHT, WIDTH
+import numpy as np
+import numpy.typing as npt
+
+from .const import HEIGHT, WIDTH, NUM_PIXELS, NUM_PIXELS_POINTS
 
 
 POINTS_HEIGHT = 5
 POINTS_WIDTH = 1
 MAX_DISTANCE = 255 * 255 * 255
+# bits per channel used to index the palette lookup table (15-bit table)
+LUT_CHANNEL_BITS = 5
 screen: Optional[curses.window] = None
 colors = []
+palette_lut = np.zeros(1 << (3 * LUT_CHANNEL_BITS), dtype=np.uint8)
 
 
 def init_curses():
@@ -39,23 +45,68 @@ def _cleanup():
 atexit.register(_cleanup)
 
 
+def create_palette() -> list[tuple[int, int, int]]:
+    step_size = 51
+    palette = []
+    for r in range(5):
+        for g in range(5):
+            for b in range(5):
+                palette.append((r * step_size, b * step_size, g * step_size))
+    return palette
+
+
 def init_colors() -> Optional[list[tuple[int, int, int]]]:
+    global palette_lut
     if not curses.can_change_color():
         print('no change of color allowed')
         return
 
-    step_size = 51
-    color_index = 0
     scale = 1000 / 255
 
-    for r in range(5):
-        for g in range(5):
-            for b in range(5):
-                color = (r * step_size, b * step_size, g * step_size)
-                colors.append(color)
-                curses.init_color(color_index, int(scale * color[0]), int(scale * color[1]), int(scale * color[2]))
-                curses.init_pair(len(colors), color_index, 0)
-                color_index += 1
+    colors.extend(create_palette())
+    for color_index, color in enumerate(colors):
+        curses.init_color(color_index, int(scale * color[0]), int(scale * color[1]), int(scale * color[2]))
+        # pair 0 is reserved for the terminal defaults
+        curses.init_pair(color_index + 1, color_index, 0)
+    palette_lut = build_palette_lut(colors)
+    return colors
+
+
+def build_palette_lut(palette: list[tuple[int, int, int]]) -> npt.NDArray[np.uint8]:
+    """Precompute the closest palette index for every quantized 24-bit color."""
+    levels = 1 << LUT_CHANNEL_BITS
+    step = 256 // levels
+    centers = np.arange(levels, dtype=np.int32) * step + step // 2
+    lut = np.zeros(levels ** 3, dtype=np.uint8)
+    if len(palette) == 0:
+        return lut
+
+    palette = np.asarray(palette, dtype=np.int32)
+    green, blue = np.meshgrid(centers, centers, indexing='ij')
+    distance_gb = (green.reshape(-1, 1) - palette[:, 1]) ** 2 + (blue.reshape(-1, 1) - palette[:, 2]) ** 2
+    for red_index, red in enumerate(centers):
+        distance = distance_gb + (red - palette[:, 0]) ** 2
+        lut[red_index * levels * levels:(red_index + 1) * levels * levels] = np.argmin(distance, axis=1)
+    return lut
+
+
+def colors_to_palette_indices(colors_24bit: npt.ArrayLike, lut: Optional[npt.NDArray[np.uint8]] = None) -> npt.NDArray[np.uint8]:
+    """Map a single color or a whole array of 24-bit colors to palette indices."""
+    if lut is None:
+        lut = palette_lut
+    colors_24bit = np.asarray(colors_24bit, dtype=np.int32)
+    shift = 8 - LUT_CHANNEL_BITS
+    mask = (1 << LUT_CHANNEL_BITS) - 1
+    red = (colors_24bit >> (16 + shift)) & mask
+    green = (colors_24bit >> (8 + shift)) & mask
+    blue = (colors_24bit >> shift) & mask
+    return lut[(red << (2 * LUT_CHANNEL_BITS)) | (green << LUT_CHANNEL_BITS) | blue]
+
+
+def palette_color_pair(color_index: int) -> int:
+    if len(colors) == 0:
+        return curses.color_pair(0)
+    return curses.color_pair(int(color_index) + 1)
 
 
 def color24_to_rgb(color_24bit: int) -> (int, int, int):
@@ -73,7 +124,7 @@ def find_closest_color_index(color: int) -> int:
     for i in range(len(colors)):
         cur_r, cur_g, cur_b = colors[i]
         delta_r = r - cur_r
-        delta_g = r - cur_g
+        delta_g = g - cur_g
         delta_b = b - cur_b
         distance = delta_r * delta_r + delta_g * delta_g + delta_b * delta_b
         if distance < min_distance:
@@ -103,7 +154,17 @@ def init_draw_areas():
     return game_area, points_a_area, points_b_area
 
 
-def rgb_to_grb(color: int) -> int:
+def rgb_to_grb(color: int | npt.NDArray[np.int32]) -> int | npt.NDArray[np.int32]:
+    # works on single colors as well as whole numpy frames
     red = (color >> 16) & 0xFF
     green = (color >> 8) & 0xFF
     return (green << 16) + (red << 8) + (color & 0xFF)
+
+
+def create_led_index_map(serpentine: bool = False) -> npt.NDArray[np.intp]:
+    """Map every (y, x) of the game area to its position on the LED strip."""
+    indices = np.arange(NUM_PIXELS, dtype=np.intp).reshape((HEIGHT, WIDTH))
+    if serpentine:
+        # every second row is wired right to left
+        indices[1::2] = indices[1::2, ::-1]
+    return indices + NUM_PIXELS_POINTS
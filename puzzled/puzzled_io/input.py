@@ -1,27 +1,38 @@
 import atexit
 import curses
-import math
+import os
+import selectors
+import sys
 import threading
 import time
 from enum import IntEnum
 from typing_extensions import TypedDict
 
+import numpy as np
+
+from .acquisition import Acquisition, AcquisitionStats
+from .events import EventQueue, InputSource
+from .polling import AdaptivePoller, PollingStats
 from .helper import init_curses
+from .lazy import LazyModule, module_available
+from .metrics import metrics
 
-try:
-    import spidev
-    import RPi.GPIO as GPIO
-    hardware_usage_possible = True
-except ImportError:
-    hardware_usage_possible = False
+# only imported once the hardware inputs get initialized
+spidev = LazyModule('spidev')
+GPIO = LazyModule('RPi.GPIO')
+hardware_usage_possible = module_available('spidev') and module_available('RPi.GPIO')
 
-from .const import POLL_RATE, WIDTH, HEIGHT, POTENTIOMETER_MAX_VALUE
+from .const import POLL_RATE, IDLE_POLL_RATE, IDLE_TIMEOUT, WIDTH, HEIGHT, POTENTIOMETER_MAX_VALUE, \
+    BRIGHTNESS_LEVELS, OVERSAMPLING, INPUT_FILTER, HYSTERESIS, KEY_RELEASE_TIMEOUT
 
 POT_A_CHANNEL = 0
 POT_B_CHANNEL = 1
 BRIGHTNESS_CHANNEL = 2
 BUTTON_A_CHANNEL = 15
 BUTTON_B_CHANNEL = 16
+# sources read through the ADC, in the order they are acquired
+ADC_SOURCES = (InputSource.pos_a, InputSource.pos_b, InputSource.brightness)
+ADC_CHANNELS = (POT_A_CHANNEL, POT_B_CHANNEL, BRIGHTNESS_CHANNEL)
 
 
 class ButtonCodes(IntEnum):
@@ -83,30 +94,56 @@ class InputStateUpdate(TypedDict, total=False):
     button_b: ButtonState
 
 
+POTENTIOMETER_SOURCES = (InputSource.pos_a, InputSource.pos_b)
+BUTTON_SOURCES = (InputSource.button_a, InputSource.button_b)
+
+
+def state_from_values(state_values) -> InputState:
+    state: InputState = {}
+    for source in POTENTIOMETER_SOURCES:
+        value, raw, _ = state_values[source]
+        state[source.name] = PotentiometerState(int(value), int(raw))
+    for source in BUTTON_SOURCES:
+        value, _, timestamp = state_values[source]
+        state[source.name] = ButtonState(ButtonStateType(value), float(timestamp))
+    return state
+
+
 class Input:
     poll_thread = None
-    input_brightness = 0
-    state: InputState = {
-        'pos_a': PotentiometerState(0, 0),
-        'pos_b': PotentiometerState(0, 0),
-        'button_a': ButtonState(ButtonStateType.released, 0),
-        'button_b': ButtonState(ButtonStateType.released, 0),
-    }
-
-    def __init__(self, steps_a=WIDTH, steps_b=HEIGHT, callback=None):
+
+    def __init__(self, steps_a=WIDTH, steps_b=HEIGHT, callback=None, oversampling=OVERSAMPLING,
+                 input_filter=INPUT_FILTER, hysteresis=HYSTERESIS, poll_rate=POLL_RATE,
+                 idle_poll_rate=IDLE_POLL_RATE, idle_timeout=IDLE_TIMEOUT, key_release_timeout=KEY_RELEASE_TIMEOUT,
+                 use_headless=False):
         self.steps_a = steps_a
         self.steps_b = steps_b
         self.callback = callback
-
-        if hardware_usage_possible:
+        self.poller = AdaptivePoller(poll_rate, idle_poll_rate, idle_timeout)
+        self.key_release_timeout = key_release_timeout
+        self.oversampling = oversampling
+        self.input_filter = input_filter
+        self.hysteresis = hysteresis
+        self.events = EventQueue()
+        # set to a SessionRecorder to log every input change
+        self.recorder = None
+        self.use_hardware = hardware_usage_possible and not use_headless
+        # without the hardware and a terminal there is nothing to read keys from
+        self.use_headless = use_headless \
+            or not (self.use_hardware or (sys.stdin is not None and sys.stdin.isatty()))
+
+        if self.use_hardware:
             self._init_hardware()
 
         # Substitute for __del__, traps an exit condition and cleans up properly
         atexit.register(self._cleanup)
 
-        self.poll_thread = Input.SpiInput(self, self.save_and_send_state_change) \
-            if hardware_usage_possible \
-            else Input.KeyboardInput(self, self.save_and_send_state_change)
+        if self.use_hardware:
+            self.poll_thread = Input.SpiInput(self, self.record_change)
+        elif self.use_headless:
+            self.poll_thread = Input.HeadlessInput()
+        else:
+            self.poll_thread = Input.KeyboardInput(self, self.record_change)
 
     def _init_hardware(self):
         GPIO.setmode(GPIO.BOARD)
@@ -120,123 +157,206 @@ class Input:
     def _cleanup(self):
         if self.poll_thread is not None:
             self.poll_thread.stop()
-        if GPIO is not None:
+        if self.use_hardware:
             GPIO.cleanup()
 
     def start(self):
         # self.poll_thread = threading.Thread(target=target, name='InputPoll', args=(1,), daemon=True)
         self.poll_thread.start()
 
+    @property
+    def state(self) -> InputState:
+        return state_from_values(self.events.snapshot()[1])
+
+    @property
+    def input_brightness(self) -> None | int:
+        """Level of the brightness knob, None until it was read."""
+        value, _, timestamp = self.events.snapshot()[1][InputSource.brightness]
+        return int(value) if timestamp else None
+
+    def snapshot(self) -> tuple[int, InputState]:
+        """Consistent state of all inputs and the event sequence it belongs to."""
+        sequence, state_values = self.events.snapshot()
+        return sequence, state_from_values(state_values)
+
+    def acquisition_stats(self) -> AcquisitionStats:
+        """Raw sample rate and change event rate of the potentiometers."""
+        if isinstance(self.poll_thread, Input.SpiInput):
+            return self.poll_thread.acquisition.stats()
+        return AcquisitionStats(0., 0.)
+
+    def polling_stats(self) -> PollingStats:
+        """Seconds spent polling at full and at idle rate."""
+        return self.poller.stats()
+
+    def drain(self) -> np.ndarray:
+        """All input events (source, value, raw, timestamp) since the last call."""
+        return self.events.drain()
+
     def handle_button_event(self, channel: int):
-        print(channel)
-        print(GPIO.input(channel))
+        timestamp = time.monotonic()
+        self.poller.notify_change()
         event_type = ButtonStateType.pressed if GPIO.input(channel) else ButtonStateType.released
-        event = ButtonState(event_type, time.time())
-        changed: InputStateUpdate = {}
         if channel == BUTTON_A_CHANNEL:
-            changed['button_a'] = event
+            self.record_change(InputSource.button_a, event_type, 0, timestamp)
         elif channel == BUTTON_B_CHANNEL:
-            changed['button_b'] = event
-        self.save_and_send_state_change(changed)
+            self.record_change(InputSource.button_b, event_type, 0, timestamp)
+
+    def record_change(self, source: InputSource, value: int, raw: int, timestamp: float) -> None:
+        start = metrics.begin()
+        metrics.count('input_events')
+        sequence = self.events.record(source, value, raw, timestamp)
+        if self.recorder is not None:
+            self.recorder.record_input(sequence, source, value, raw, timestamp)
+        if self.callback is not None and source != InputSource.brightness:
+            if source in POTENTIOMETER_SOURCES:
+                change = {source.name: PotentiometerState(value, raw)}
+            else:
+                change = {source.name: ButtonState(ButtonStateType(value), timestamp)}
+            self.callback(change)
+        metrics.end('input_change', start)
 
     def save_and_send_state_change(self, change: InputStateUpdate) -> None:
-        self.state.update(change)
-        if self.callback is not None:
-            self.callback(change)
+        timestamp = time.monotonic()
+        for field, field_state in change.items():
+            source = InputSource[field]
+            if source in POTENTIOMETER_SOURCES:
+                self.record_change(source, field_state.quantized, field_state.raw, timestamp)
+            else:
+                self.record_change(source, field_state.type, 0, field_state.since)
 
     class SpiInput(threading.Thread):
         def __init__(self, parent, callback):
             threading.Thread.__init__(self, name='SpiInputPoller', daemon=True)
             self.parent = parent
-            self.input_state = parent.state
             self.callback = callback
+            self.running = True
             self.spi = spidev.SpiDev()
             self.spi.open(0, 0)
             self.spi.max_speed_hz = 1000000  # 1MHz
             self.spi.bits_per_word = 8
             self.spi.mode = 3
-            self.step_width_a = POTENTIOMETER_MAX_VALUE / parent.steps_a
-            self.step_width_b = POTENTIOMETER_MAX_VALUE / parent.steps_b
-            self.step_width_brightness = POTENTIOMETER_MAX_VALUE / 127
+            step_widths = (
+                POTENTIOMETER_MAX_VALUE / parent.steps_a,
+                POTENTIOMETER_MAX_VALUE / parent.steps_b,
+                POTENTIOMETER_MAX_VALUE / BRIGHTNESS_LEVELS,
+            )
+            self.acquisition = Acquisition(self.spi, ADC_CHANNELS, step_widths, parent.oversampling,
+                                           parent.input_filter, parent.hysteresis)
+            # nothing read yet, so the first read reports every potentiometer, even at 0
+            self.last_values = [-1] * len(InputSource)
 
         def run(self):
-            while True:
-                changed = self.read_player_inputs()
-                self.callback(changed)
-                self.parent.input_brightness = self.read(BRIGHTNESS_CHANNEL, 127).quantized
-                time.sleep(1. / POLL_RATE)
+            while self.running:
+                changed = self.read_inputs()
+                self.parent.poller.wait(changed)
 
         def stop(self):
-            self.join()
+            self.running = False
+            if self.is_alive():
+                self.join()
             if self.spi is not None:
                 self.spi.close()
 
-        def read_player_inputs(self) -> InputStateUpdate:
-            changed: InputStateUpdate = {}
-            pos_a = self.read(POT_A_CHANNEL, self.step_width_a)
-            if pos_a.quantized != self.input_state['pos_a'].quantized:
-                changed['pos_a'] = pos_a
-            pos_b = self.read(POT_B_CHANNEL, self.step_width_b)
-            if pos_b.quantized != self.input_state['pos_b'].quantized:
-                changed['pos_b'] = pos_b
+        def read_inputs(self) -> bool:
+            start = metrics.begin()
+            timestamp = time.monotonic()
+            values = self.acquisition.read()
+            metrics.end('adc_read', start)
+            changed = False
+            for source, (quantized, raw) in zip(ADC_SOURCES, values):
+                if quantized != self.last_values[source]:
+                    self.last_values[source] = quantized
+                    self.acquisition.events.add()
+                    self.callback(source, quantized, raw, timestamp)
+                    changed = True
             return changed
 
-        def read(self, channel, step_width):
-            cmd = [0b00000110, channel << 6, 0]
-            reply_bytes = self.spi.xfer2(cmd)
-            raw = ((reply_bytes[1] & 15) << 8) + reply_bytes[2]
-            return PotentiometerState(math.floor(raw / step_width), raw)
+    class HeadlessInput:
+        """Reads no device at all, inputs only come in through record_change,
+        e.g. from a replay or a test.
+        """
+
+        def start(self):
+            pass
+
+        def stop(self):
+            pass
 
     class KeyboardInput(threading.Thread):
-        screen = init_curses()
-        last_key = -1
-        key_one_before = -1
+        """Waits for key presses on stdin instead of polling. Terminals do not
+        report key releases, so a button counts as released once its key did
+        not repeat for `key_release_timeout` seconds.
+        """
 
         def __init__(self, parent, callback):
             threading.Thread.__init__(self, name='KeyboardInputPoller', daemon=True)
             self.parent = parent
-            self.input_state = parent.state
             self.callback = callback
+            self.positions = {InputSource.pos_a: 0, InputSource.pos_b: 0}
+            self.pressed_key: None | int = None
+            self.pressed_last_seen = 0.
+            self.running = True
+            self.screen = init_curses()
+            # stop() writes into this pipe to wake up the blocking select
+            self.wake_read, self.wake_write = os.pipe()
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(sys.stdin.fileno(), selectors.EVENT_READ)
+            self.selector.register(self.wake_read, selectors.EVENT_READ)
 
         def run(self):
-            while True:
-                key = self.screen.getch()
-                if key == curses.ERR and key == self.last_key:
-                    pass
-                elif key in KEYBOARD_BUTTON_KEYS and key != self.last_key:
-                    self.handle_keyboard_button(key, ButtonStateType.pressed)
-                elif key == curses.ERR and self.last_key in KEYBOARD_BUTTON_KEYS:
-                    self.handle_keyboard_button(self.last_key, ButtonStateType.released)
+            while self.running:
+                timeout = None
+                if self.pressed_key is not None:
+                    timeout = max(0., self.pressed_last_seen + self.parent.key_release_timeout - time.monotonic())
+                if self.selector.select(timeout):
+                    self.read_keys()
+                if self.pressed_key is not None \
+                        and time.monotonic() - self.pressed_last_seen >= self.parent.key_release_timeout:
+                    self.handle_keyboard_button(self.pressed_key, ButtonStateType.released)
+                    self.pressed_key = None
+
+        def read_keys(self) -> None:
+            key = self.screen.getch()
+            while key != curses.ERR:
+                if key in KEYBOARD_BUTTON_KEYS:
+                    self.pressed_last_seen = time.monotonic()
+                    if key != self.pressed_key:
+                        if self.pressed_key is not None:
+                            self.handle_keyboard_button(self.pressed_key, ButtonStateType.released)
+                        self.handle_keyboard_button(key, ButtonStateType.pressed)
+                        self.pressed_key = key
                 elif key in KEYBOARD_POSITION_KEYS:
                     self.handle_keyboard_direction(key)
-                self.last_key = key
-                time.sleep(1. / POLL_RATE)
+                key = self.screen.getch()
 
         def stop(self):
-            self.join()
+            self.running = False
+            os.write(self.wake_write, b'\0')
+            if self.is_alive():
+                self.join()
+            self.selector.close()
+            os.close(self.wake_read)
+            os.close(self.wake_write)
 
         def handle_keyboard_direction(self, key: int) -> None:
             manipulate_pos_a = key == ButtonCodes.pot_a_add or key == ButtonCodes.pot_a_sub
             adding = key == ButtonCodes.pot_a_add or key == ButtonCodes.pot_b_add
 
-            old_value = (self.input_state['pos_a'] if manipulate_pos_a else self.input_state['pos_b']).quantized
+            source = InputSource.pos_a if manipulate_pos_a else InputSource.pos_b
+            old_value = self.positions[source]
             max_value = (self.parent.steps_a if manipulate_pos_a else self.parent.steps_b) - 1
 
             new_value = old_value + 1 if adding else old_value - 1
             new_value = min(max(new_value, 0), max_value)
 
             if new_value != old_value:
-                field = 'pos_a' if manipulate_pos_a else 'pos_b'
-                changed = {
-                    field: PotentiometerState(new_value, new_value),
-                }
-                self.callback(changed)
+                self.positions[source] = new_value
+                self.callback(source, new_value, new_value, time.monotonic())
 
         def handle_keyboard_button(self, key: int, event_type: ButtonStateType) -> None:
-            event = ButtonState(event_type, time.time())
-            changed: InputStateUpdate = {}
+            timestamp = time.monotonic()
             if key == ButtonCodes.button_a:
-                changed['button_a'] = event
+                self.callback(InputSource.button_a, event_type, 0, timestamp)
             elif key == ButtonCodes.button_b:
-                changed['button_b'] = event
-            self.callback(changed)
+                self.callback(InputSource.button_b, event_type, 0, timestamp)
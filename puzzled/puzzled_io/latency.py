@@ -0,0 +1,56 @@
+import numpy as np
+import numpy.typing as npt
+
+# amount of latencies the percentiles are computed over
+LATENCY_WINDOW = 1024
+
+
+class LatencyStats(tuple):
+    def __new__(cls, count: int, p50: float, p95: float, p99: float, max: float):
+        return tuple.__new__(cls, (count, p50, p95, p99, max))
+
+    @property
+    def count(self) -> int:
+        return self[0]
+
+    @property
+    def p50(self) -> float:
+        return self[1]
+
+    @property
+    def p95(self) -> float:
+        return self[2]
+
+    @property
+    def p99(self) -> float:
+        return self[3]
+
+    @property
+    def max(self) -> float:
+        return self[4]
+
+
+class LatencyTracker:
+    """Rolling window of input to photon latencies: the time from acquiring
+    an input to the frame showing it having been pushed to the outputs.
+
+    The window and its counter can live in shared memory, so the output
+    process can add latencies the game process reports.
+    """
+
+    def __init__(self, values: None | npt.NDArray[np.float64] = None, count: None | npt.NDArray[np.uint64] = None):
+        self.values = np.zeros(LATENCY_WINDOW, np.float64) if values is None else values
+        self.count = np.zeros(1, np.uint64) if count is None else count
+
+    def add(self, latency: float) -> None:
+        count = int(self.count[0])
+        self.values[count % len(self.values)] = latency
+        self.count[0] = count + 1
+
+    def stats(self) -> LatencyStats:
+        count = int(self.count[0])
+        values = self.values[:min(count, len(self.values))]
+        if len(values) == 0:
+            return LatencyStats(0, 0., 0., 0., 0.)
+        p50, p95, p99 = np.percentile(values, (50, 95, 99))
+        return LatencyStats(count, float(p50), float(p95), float(p99), float(values.max()))
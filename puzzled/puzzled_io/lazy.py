@@ -0,0 +1,29 @@
+import importlib
+import importlib.util
+
+
+def module_available(name: str) -> bool:
+    """Check whether a module could be imported, without importing it."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        # parent package is missing
+        return False
+
+
+class LazyModule:
+    """Module-level singleton standing in for a module, which only gets
+    imported on first attribute access.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        value = getattr(self._module, attribute)
+        # cache it, so later lookups do not end up here again
+        setattr(self, attribute, value)
+        return value
@@ -0,0 +1,58 @@
+import math
+import time
+
+import numpy as np
+import numpy.typing as npt
+
+from .const import WIDTH
+
+
+# empty columns between the end of a wrapping text and its start
+MARQUEE_GAP = 5
+
+
+class Marquee:
+    """Scrolls a compiled text mask through the game area. The strip is built
+    once, so that every frame's window is a view into it and no new array.
+    """
+
+    def __init__(self, mask: npt.NDArray[np.bool_], columns_per_frame: float = 1.,
+                 columns_per_second: None | float = None, wrap: bool = True, gap: int = MARQUEE_GAP):
+        self.columns_per_frame = columns_per_frame
+        self.columns_per_second = columns_per_second
+        self.wrap = wrap
+        height, width = mask.shape
+        if wrap:
+            self.period = width + gap
+            base = np.zeros((height, self.period), dtype=bool)
+            base[:, :width] = mask
+            # repeat the start behind the end, so windows never need to wrap
+            repeats = math.ceil((self.period + WIDTH) / self.period)
+            self.strip = np.tile(base, repeats)[:, :self.period + WIDTH]
+        else:
+            # enters on the right and leaves on the left
+            self.period = width + WIDTH
+            self.strip = np.zeros((height, width + 2 * WIDTH), dtype=bool)
+            self.strip[:, WIDTH:WIDTH + width] = mask
+        self.strip.flags.writeable = False
+        self.position = 0.
+        self.started = time.monotonic()
+
+    @property
+    def finished(self) -> bool:
+        return not self.wrap and self.position >= self.period
+
+    def advance(self) -> npt.NDArray[np.bool_]:
+        """Move on by one frame and return the window to show."""
+        if self.columns_per_second is not None:
+            self.position = (time.monotonic() - self.started) * self.columns_per_second
+        else:
+            self.position += self.columns_per_frame
+        return self.window()
+
+    def window(self) -> npt.NDArray[np.bool_]:
+        if self.wrap:
+            offset = int(self.position) % self.period
+        else:
+            offset = min(int(self.position), self.period)
+        return self.strip[:, offset:offset + WIDTH]
@@ -0,0 +1,196 @@
+"""Per stage timings and counters of the render and input paths.
+
+The hot paths are instrumented through the `metrics` singleton:
+
+    start = metrics.begin()
+    ...
+    metrics.end('stage', start)
+
+While disabled begin() returns 0 and end() returns right away, so the hooks
+cost two calls. MetricsExporter periodically writes a snapshot as a JSON line
+to a file or a Unix datagram socket. Snapshots of other processes, like the
+output process of the screen, are merged in through add_source().
+"""
+import json
+import socket
+import threading
+import time
+from typing import Callable, Optional, TextIO
+
+import numpy as np
+
+# amount of samples every stage keeps for its percentiles
+METRICS_WINDOW = 1024
+METRICS_INTERVAL = 1.
+# prefix of an export target naming a Unix datagram socket instead of a file
+UNIX_SOCKET_PREFIX = 'unix:'
+
+
+class Histogram:
+    """Rolling window of the latest durations of a stage."""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self.values = np.zeros(window, np.float64)
+        self.count = 0
+        # stages are timed from several threads, e.g. the game loop and the render thread
+        self._lock = threading.Lock()
+
+    def add(self, value: float) -> None:
+        with self._lock:
+            self.values[self.count % self.window] = value
+            self.count += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            count = self.count
+            values = self.values[:min(count, self.window)].copy()
+        if len(values) == 0:
+            return {'count': 0}
+        p50, p95, p99 = np.percentile(values, (50, 95, 99))
+        return {
+            'count': count,
+            'mean': float(values.mean()),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'max': float(values.max()),
+        }
+
+
+class Metrics:
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self.enabled = False
+        self.stages: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+        # counted from the input threads and the game loop
+        self._counter_lock = threading.Lock()
+        # snapshots of other processes, None if one is not available right now
+        self.sources: list[Callable[[], None | dict]] = []
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def begin(self) -> float:
+        return time.perf_counter() if self.enabled else 0.
+
+    def end(self, stage: str, start: float) -> None:
+        if not start:
+            return
+        self._histogram(stage).add(time.perf_counter() - start)
+
+    def observe(self, stage: str, duration: float) -> None:
+        """Add a duration measured elsewhere, e.g. across threads."""
+        if self.enabled:
+            self._histogram(stage).add(duration)
+
+    def _histogram(self, stage: str) -> Histogram:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages.setdefault(stage, Histogram(self.window))
+        return histogram
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        if self.enabled:
+            with self._counter_lock:
+                self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def add_source(self, source: Callable[[], None | dict]) -> None:
+        self.sources.append(source)
+
+    def remove_source(self, source: Callable[[], None | dict]) -> None:
+        if source in self.sources:
+            self.sources.remove(source)
+
+    def snapshot(self) -> dict:
+        with self._counter_lock:
+            counters = dict(self.counters)
+        stages = {stage: histogram.summary() for stage, histogram in list(self.stages.items())}
+        for source in list(self.sources):
+            other = source()
+            if other is None:
+                continue
+            stages.update(other['stages'])
+            for counter, total in other['counters'].items():
+                counters[counter] = counters.get(counter, 0) + total
+        return {'stages': stages, 'counters': counters}
+
+    def reset(self) -> None:
+        self.stages = {}
+        with self._counter_lock:
+            self.counters = {}
+
+
+metrics = Metrics()
+
+
+class MetricsExporter(threading.Thread):
+    """Writes a snapshot of the metrics every `interval` seconds as one JSON
+    line, with the rate per second of every counter since the last line.
+    `target` is a file path, or 'unix:' followed by the path of a datagram
+    socket. Lines nobody receives on the socket are dropped.
+    """
+
+    def __init__(self, target: str, interval: float = METRICS_INTERVAL, source: Metrics = metrics):
+        threading.Thread.__init__(self, name='MetricsExporter', daemon=True)
+        self.target = target
+        self.interval = interval
+        self.source = source
+        self.stopped = threading.Event()
+        self._file: Optional[TextIO] = None
+        self._socket: Optional[socket.socket] = None
+        self._socket_path: None | str = None
+        self._previous_counters: dict[str, int] = {}
+        self._previous_time = time.monotonic()
+        self.lines_dropped = 0
+        if target.startswith(UNIX_SOCKET_PREFIX):
+            self._socket_path = target[len(UNIX_SOCKET_PREFIX):]
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+        else:
+            self._file = open(target, 'a')
+
+    def line(self) -> str:
+        now = time.monotonic()
+        elapsed = now - self._previous_time
+        snapshot = self.source.snapshot()
+        counters = snapshot['counters']
+        snapshot['time'] = now
+        snapshot['rates'] = {
+            counter: (total - self._previous_counters.get(counter, 0)) / elapsed if elapsed > 0 else 0.
+            for counter, total in counters.items()
+        }
+        self._previous_counters = counters
+        self._previous_time = now
+        return json.dumps(snapshot, separators=(',', ':'))
+
+    def export(self) -> None:
+        line = self.line()
+        if self._file is not None:
+            self._file.write(line + '\n')
+            self._file.flush()
+            return
+        try:
+            self._socket.sendto(line.encode(), self._socket_path)
+        except OSError:
+            # no listener or its queue is full, the next line will try again
+            self.lines_dropped += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
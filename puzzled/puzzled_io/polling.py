@@ -0,0 +1,54 @@
+import time
+
+
+class PollingStats(tuple):
+    def __new__(cls, active_time: float, idle_time: float, idle: bool):
+        return tuple.__new__(cls, (active_time, idle_time, idle))
+
+    @property
+    def active_time(self) -> float:
+        return self[0]
+
+    @property
+    def idle_time(self) -> float:
+        return self[1]
+
+    @property
+    def idle(self) -> bool:
+        return self[2]
+
+
+class AdaptivePoller:
+    """Sleeps between two polls. Polls at `rate` while the input changes and
+    falls back to `idle_rate` after nothing changed for `idle_timeout` seconds.
+    The first change switches back to the full rate.
+    """
+
+    def __init__(self, rate: float, idle_rate: float, idle_timeout: float):
+        self.interval = 1. / rate
+        self.idle_interval = 1. / idle_rate
+        self.idle_timeout = idle_timeout
+        self.idle = False
+        self.last_change = time.monotonic()
+        self.last_wait: None | float = None
+        self.active_time = 0.
+        self.idle_time = 0.
+
+    def notify_change(self) -> None:
+        self.last_change = time.monotonic()
+
+    def wait(self, changed: bool) -> None:
+        now = time.monotonic()
+        if changed:
+            self.last_change = now
+        if self.last_wait is not None:
+            if self.idle:
+                self.idle_time += now - self.last_wait
+            else:
+                self.active_time += now - self.last_wait
+        self.last_wait = now
+        self.idle = now - self.last_change >= self.idle_timeout
+        time.sleep(self.idle_interval if self.idle else self.interval)
+
+    def stats(self) -> PollingStats:
+        return PollingStats(self.active_time, self.idle_time, self.idle)
@@ -0,0 +1,236 @@
+"""Session recording: an append-only binary log of every rendered frame and
+every input change, and a driver replaying it through the game.
+
+The log starts with a header, followed by records of a fixed record header
+(kind, monotonic timestamp, payload size) and a payload:
+
+- keyframe: input sequence of the frame, the complete frame
+- delta: input sequence of the frame, indices and XOR of the changed pixels
+  against the previous frame
+- input: event sequence, source, value and raw value
+
+The input sequence of a frame is the amount of input events the game had seen
+when it composed the frame, so a replay can feed exactly those before
+rendering the frame again.
+"""
+import mmap
+import struct
+import threading
+import time
+from typing import BinaryIO, Callable, Iterator, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from .const import TOTAL_AMOUNT_LEDS
+from .events import EVENT_DTYPE, InputSource
+
+SESSION_MAGIC = b'PZRC'
+SESSION_VERSION = 1
+FILE_HEADER = struct.Struct('<4sHH')
+RECORD_HEADER = struct.Struct('<BdI')
+FRAME_PREFIX = struct.Struct('<q')
+DELTA_PREFIX = struct.Struct('<qH')
+INPUT_RECORD = struct.Struct('<qBii')
+
+KIND_KEYFRAME = 1
+KIND_DELTA = 2
+KIND_INPUT = 3
+
+# a keyframe every this many frames bounds the work of a random access
+KEYFRAME_INTERVAL = 64
+
+
+class SessionRecorder:
+    """Appends frames and input events to a session log. Safe to use from the
+    input threads and the game loop at the same time.
+    """
+
+    def __init__(self, path: str, frame_size: int = TOTAL_AMOUNT_LEDS):
+        self.frame_size = frame_size
+        self._file: Optional[BinaryIO] = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, frame_size))
+        self._lock = threading.Lock()
+        self._previous = np.zeros(frame_size, np.int32)
+        self._frames_since_keyframe: None | int = None
+        self.frame_count = 0
+        self.input_count = 0
+
+    def _write(self, kind: int, timestamp: float, *payload: bytes) -> None:
+        # called with the lock held
+        self._file.write(RECORD_HEADER.pack(kind, timestamp, sum(len(part) for part in payload)))
+        for part in payload:
+            self._file.write(part)
+
+    def record_frame(self, frame: npt.NDArray[np.int32], input_sequence: int = 0,
+                     timestamp: None | float = None) -> None:
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            if self._file is None:
+                return
+            changes = np.bitwise_xor(frame, self._previous)
+            indices = np.flatnonzero(changes).astype('<u2')
+            # a delta entry is 6 bytes, a keyframe pixel 4
+            keyframe = self._frames_since_keyframe is None \
+                or self._frames_since_keyframe + 1 >= KEYFRAME_INTERVAL \
+                or len(indices) * 6 >= self.frame_size * 4
+            if keyframe:
+                self._write(KIND_KEYFRAME, timestamp, FRAME_PREFIX.pack(input_sequence),
+                            np.ascontiguousarray(frame, '<i4').tobytes())
+                self._frames_since_keyframe = 0
+            else:
+                self._write(KIND_DELTA, timestamp, DELTA_PREFIX.pack(input_sequence, len(indices)),
+                            indices.tobytes(), changes[indices].astype('<i4').tobytes())
+                self._frames_since_keyframe += 1
+            np.copyto(self._previous, frame)
+            self.frame_count += 1
+
+    def record_input(self, sequence: int, source: InputSource, value: int, raw: int, timestamp: float) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._write(KIND_INPUT, timestamp, INPUT_RECORD.pack(sequence, source, value, raw))
+            self.input_count += 1
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SessionReader:
+    """Memory maps a session log. The records are indexed once on opening, any
+    frame can then be decoded from the keyframe before it.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.frame_size = FILE_HEADER.unpack_from(self._map)
+        if magic != SESSION_MAGIC or version != SESSION_VERSION:
+            raise ValueError(f'{path} is no session log of version {SESSION_VERSION}')
+        self._index_records()
+
+    def _index_records(self) -> None:
+        frame_offsets, frame_kinds, frame_times = [], [], []
+        input_offsets, input_times = [], []
+        offset = FILE_HEADER.size
+        end = len(self._map)
+        while offset + RECORD_HEADER.size <= end:
+            kind, timestamp, size = RECORD_HEADER.unpack_from(self._map, offset)
+            payload = offset + RECORD_HEADER.size
+            if payload + size > end:
+                # cut off while writing, ignore the incomplete record
+                break
+            if kind == KIND_INPUT:
+                input_offsets.append(payload)
+                input_times.append(timestamp)
+            else:
+                frame_offsets.append(payload)
+                frame_kinds.append(kind)
+                frame_times.append(timestamp)
+            offset = payload + size
+        self.frame_offsets = np.array(frame_offsets, np.int64)
+        self.frame_kinds = np.array(frame_kinds, np.uint8)
+        self.frame_timestamps = np.array(frame_times, np.float64)
+        self.keyframes = np.flatnonzero(self.frame_kinds == KIND_KEYFRAME)
+        self._input_offsets = input_offsets
+        self._input_times = input_times
+
+    def __len__(self) -> int:
+        return len(self.frame_offsets)
+
+    def _input_sequence(self, index: int) -> int:
+        return FRAME_PREFIX.unpack_from(self._map, self.frame_offsets[index])[0]
+
+    def _apply(self, index: int, frame: npt.NDArray[np.int32]) -> None:
+        offset = int(self.frame_offsets[index])
+        if self.frame_kinds[index] == KIND_KEYFRAME:
+            frame[:] = np.frombuffer(self._map, '<i4', self.frame_size, offset + FRAME_PREFIX.size)
+            return
+        _, count = DELTA_PREFIX.unpack_from(self._map, offset)
+        offset += DELTA_PREFIX.size
+        indices = np.frombuffer(self._map, '<u2', count, offset)
+        frame[indices] ^= np.frombuffer(self._map, '<i4', count, offset + 2 * count)
+
+    def frame(self, index: int) -> tuple[float, int, npt.NDArray[np.int32]]:
+        """Timestamp, input sequence and pixels of a frame."""
+        if not 0 <= index < len(self):
+            raise IndexError(f'no frame {index}')
+        keyframe = int(self.keyframes[np.searchsorted(self.keyframes, index, 'right') - 1])
+        frame = np.zeros(self.frame_size, np.int32)
+        for position in range(keyframe, index + 1):
+            self._apply(position, frame)
+        return float(self.frame_timestamps[index]), self._input_sequence(index), frame
+
+    def frames(self) -> Iterator[tuple[float, int, npt.NDArray[np.int32]]]:
+        """All frames in order. The yielded array is reused for the next frame."""
+        frame = np.zeros(self.frame_size, np.int32)
+        for index in range(len(self)):
+            self._apply(index, frame)
+            yield float(self.frame_timestamps[index]), self._input_sequence(index), frame
+
+    def inputs(self) -> np.ndarray:
+        """All input events ordered by their sequence."""
+        events = np.zeros(len(self._input_offsets), EVENT_DTYPE)
+        for position, (offset, timestamp) in enumerate(zip(self._input_offsets, self._input_times)):
+            events[position] = (*INPUT_RECORD.unpack_from(self._map, offset), timestamp)
+        return np.sort(events, order='sequence')
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class ReplayResult(tuple):
+    def __new__(cls, frames: int, mismatches: int, first_mismatch: None | int):
+        return tuple.__new__(cls, (frames, mismatches, first_mismatch))
+
+    @property
+    def frames(self) -> int:
+        return self[0]
+
+    @property
+    def mismatches(self) -> int:
+        return self[1]
+
+    @property
+    def first_mismatch(self) -> None | int:
+        return self[2]
+
+
+def replay(reader: SessionReader, record_change: Callable[[InputSource, int, int, float], None],
+           step: Callable[[], npt.NDArray[np.int32]], speed: None | float = 1.) -> ReplayResult:
+    """Feed the recorded inputs through `record_change` (usually
+    Input.record_change) and call `step` for every recorded frame. `step`
+    renders one frame and returns it, it is compared against the recording.
+    A speed of None replays as fast as possible.
+    """
+    events = reader.inputs()
+    next_event = 0
+    mismatches = 0
+    first_mismatch = None
+    start = time.monotonic()
+    first_timestamp = None
+    for index, (timestamp, input_sequence, recorded) in enumerate(reader.frames()):
+        if speed is not None:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = start + (timestamp - first_timestamp) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        while next_event < len(events) and events[next_event]['sequence'] <= input_sequence:
+            event = events[next_event]
+            record_change(InputSource(event['source']), int(event['value']), int(event['raw']),
+                          float(event['timestamp']))
+            next_event += 1
+        if not np.array_equal(step(), recorded):
+            mismatches += 1
+            if first_mismatch is None:
+                first_mismatch = index
+    return ReplayResult(len(reader), mismatches, first_mismatch)
@@ -1,19 +1,29 @@
 import atexit
+import ctypes
 import curses
+import threading
+import time
 from typing import Union
 
 import numpy as np
 
-from .font import GLYPHS
+from .ansi import AnsiTerminal
+from .compositor import Compositor, Layer
+from .correction import ColorCorrection, build_led_lut, build_display_lut, MAX_BRIGHTNESS
+from .font import compile_text, VerticalAlignment
+from .headless import HeadlessOutput
+from .lazy import LazyModule, module_available
+from .latency import LatencyTracker, LatencyStats
+from .marquee import Marquee, MARQUEE_GAP
+from .metrics import metrics
 
-try:
-    import rpi_ws281x as ws
-    led_usage_possible = True
-except ImportError:
-    led_usage_possible = False
+# only imported once the leds get initialized
+ws = LazyModule('rpi_ws281x')
+led_usage_possible = module_available('rpi_ws281x')
 
-from .const import NUM_PIXELS, NUM_PIXELS_POINTS, WIDTH, HEIGHT
-from .helper import init_curses, init_draw_areas, find_closest_color_index, rgb_to_grb
+from .const import NUM_PIXELS_POINTS, TOTAL_AMOUNT_LEDS, WIDTH, HEIGHT, DEFAULT_BRIGHTNESS
+from .helper import init_curses, init_draw_areas, colors_to_palette_indices, palette_color_pair, rgb_to_grb, \
+    create_led_index_map, POINTS_HEIGHT
 
 
 # GPIO pin connected to the pixels (must support PWM!).
@@ -25,8 +35,14 @@ LED_DMA = 10
 # True to invert the signal (when using NPN transistor level shift)
 LED_INVERT = False
 LED_CHANNEL = 0
+# True if every second row of the game area is wired in reverse (serpentine)
+LED_SERPENTINE = False
 
-TOTAL_AMOUNT_LEDS = NUM_PIXELS + NUM_PIXELS_POINTS
+# z order of the built-in layers, sprites go in between
+BACKGROUND_Z = 0
+SPRITE_Z = 10
+TEXT_Z = 100
+TEXT_COLOR = 0xffffff
 
 
 # LED_STRIP = ws.WS2811_STRIP_RGB
@@ -34,25 +50,98 @@ TOTAL_AMOUNT_LEDS = NUM_PIXELS + NUM_PIXELS_POINTS
 # LED_STRIP = ws.SK6812_STRIP_RGBW
 # LED_STRIP = ws.SK6812W_STRIP
 
+class RenderStats(tuple):
+    def __new__(cls, frames_pushed: int, frames_dropped: int, push_time_last: float, push_time_total: float):
+        return tuple.__new__(cls, (frames_pushed, frames_dropped, push_time_last, push_time_total))
+
+    @property
+    def frames_pushed(self) -> int:
+        return self[0]
+
+    @property
+    def frames_dropped(self) -> int:
+        return self[1]
+
+    @property
+    def push_time_last(self) -> float:
+        return self[2]
+
+    @property
+    def push_time_average(self) -> float:
+        return self[3] / self[0] if self[0] else 0.
+
+
 # code is a kind of copy pasta from
 # https://github.com/rpi-ws281x/rpi-ws281x-python/blob/master/library/rpi_ws281x/rpi_ws281x.py
 
 class Screen:
-    def __init__(self, use_leds=led_usage_possible, use_terminal=False):
+    def __init__(self, use_leds=led_usage_possible, use_terminal=False, use_ansi=False, threaded=False,
+                 out_of_process=False, use_headless=False, hash_frames=False):
         self._leds = None
+        self._render_thread: None | Screen.RenderThread = None
+        self._output_process = None
+        self._led_buffer: None | np.ndarray = None
+        self._ansi: None | AnsiTerminal = None
         self.use_leds = use_leds and led_usage_possible
-        self.use_terminal = use_terminal or not use_leds
+        self.use_ansi = use_ansi
+        # the terminal is the fallback when no other output is available
+        self.use_terminal = use_terminal or not (self.use_leds or use_ansi or use_headless)
+        # the headless output always lives in this process, so the frames can be inspected
+        self.headless = HeadlessOutput(hash_frames=hash_frames) if use_headless else None
         self.size = TOTAL_AMOUNT_LEDS
+        # None until set_brightness() was called, the outputs keep their own defaults until then:
+        # the LEDs a low one, displays full brightness, as development machines have no knob
+        self.brightness: None | int = None
+        self._led_correction = ColorCorrection(build_led_lut, brightness=DEFAULT_BRIGHTNESS)
+        self._display_correction = ColorCorrection(build_display_lut)
         self.game_area_pixel = np.full((HEIGHT, WIDTH), 0, np.int32)
         self.cur_text_mask: None | np.ndarray[bool] = None
+        self.marquee: None | Marquee = None
+        # set to a SessionRecorder to log every rendered frame
+        self.recorder = None
+        # sequence of the latest input event the game loop took into account
+        self.input_sequence = 0
+        # acquisition time of the oldest input not rendered yet, see mark_input()
+        self._input_time: None | float = None
+        self.latency = LatencyTracker()
+
+        if out_of_process and (self.use_leds or self.use_terminal or self.use_ansi):
+            # imported here, as multiprocessing is not needed otherwise
+            from .shared import OutputProcess
+            # outputs are owned by the output process, render() copies every frame into shared memory
+            self._output_process = OutputProcess(self.use_leds, self.use_terminal, self.use_ansi)
+            self.use_leds = self.use_terminal = self.use_ansi = False
+            threaded = False
+            # filled by the output process, which knows when a frame got shown
+            self.latency = LatencyTracker(self._output_process.frame.latencies,
+                                          self._output_process.frame.latency_count)
+        # private, the point areas are changed between renders and the output process must not see that
+        self.frame = np.zeros(TOTAL_AMOUNT_LEDS, np.int32)
+        # the frame is what all outputs show: both point areas followed by the game area
+        self.frame_points = self.frame[:NUM_PIXELS_POINTS].reshape((2, POINTS_HEIGHT))
+        self.frame_game_area = self.frame[NUM_PIXELS_POINTS:].reshape((HEIGHT, WIDTH))
+
+        self.compositor = Compositor(self.frame_game_area)
+        self.background = self.compositor.add_layer(Layer(HEIGHT, WIDTH, BACKGROUND_Z, pixels=self.game_area_pixel))
+        self._text_layer = self.compositor.add_layer(Layer(HEIGHT, WIDTH, TEXT_Z, visible=False))
+        self._text_layer.fill(TEXT_COLOR)
+        self._text_layer_source: None | np.ndarray = None
 
         if self.use_leds:
             self._init_leds()
             self._begin()
+            self._init_led_buffer()
 
         if self.use_terminal:
             self._init_terminal()
 
+        if self.use_ansi:
+            self._init_ansi()
+
+        if threaded:
+            self._render_thread = Screen.RenderThread(self)
+            self._render_thread.start()
+
         # Substitute for __del__, traps an exit condition and cleans up properly
         atexit.register(self._cleanup)
 
@@ -95,14 +184,23 @@ class Screen:
         ws.ws2811_channel_t_count_set(self._channel, TOTAL_AMOUNT_LEDS)
         ws.ws2811_channel_t_gpionum_set(self._channel, LED_PIN)
         ws.ws2811_channel_t_invert_set(self._channel, 0)
-        # start with low value for brightness (until hooked up to input)
-        ws.ws2811_channel_t_brightness_set(self._channel, 10)
+        # brightness is applied by the output color correction
+        ws.ws2811_channel_t_brightness_set(self._channel, 255)
         ws.ws2811_channel_t_strip_type_set(self._channel, ws.WS2811_STRIP_GRB)
 
         # Initialize the controller
         ws.ws2811_t_freq_set(self._leds, LED_FREQ_HZ)
         ws.ws2811_t_dmanum_set(self._leds, LED_DMA)
 
+    def _init_led_buffer(self):
+        # the led array is allocated by ws2811_init; map it as numpy array so a
+        # whole frame can be written with a single copy instead of one SWIG
+        # call per pixel
+        address = int(ws.ws2811_channel_t_leds_get(self._channel))
+        leds = (ctypes.c_uint32 * TOTAL_AMOUNT_LEDS).from_address(address)
+        self._led_buffer = np.ctypeslib.as_array(leds)
+        self._led_index_map = create_led_index_map(LED_SERPENTINE)
+
     def _reset_leds(self):
         # Initialize the channels to zero
         for channel_number in range(2):
@@ -113,19 +211,65 @@ class Screen:
             ws.ws2811_channel_t_brightness_set(channel, 0)
 
     def _init_terminal(self):
+        # curses is not thread safe, the render thread draws while redraw_terminal() may be called by the game
+        self._terminal_lock = threading.Lock()
         self.screen = init_curses()
+        self._terminal_size = self.screen.getmaxyx()
+        # palette indices currently shown, used to only redraw changed cells
+        self._terminal_frame: None | np.ndarray = None
+        # window and position of every pixel of the frame
+        self._terminal_cells = [(int(set_b_area), pos + 1, 2) for set_b_area in (False, True)
+                                for pos in range(POINTS_HEIGHT)]
+        self._terminal_cells += [(2, y + 1, x * 2 + 2) for y in range(HEIGHT) for x in range(WIDTH)]
+        self._init_draw_areas()
+
+    def _init_draw_areas(self):
         game_area, points_a_area, points_b_area = init_draw_areas()
         self.game_area = game_area
         self.points_a_area = points_a_area
         self.points_b_area = points_b_area
+        self._terminal_windows = (points_a_area, points_b_area, game_area)
+
+    def redraw_terminal(self):
+        """Force a full redraw of the terminal on the next render, e.g. after
+        the terminal got resized. Does nothing without a terminal output.
+        """
+        if self._output_process is not None:
+            self._output_process.request_redraw()
+        elif self.use_terminal:
+            with self._terminal_lock:
+                self._redraw_terminal_locked()
+
+    def _redraw_terminal_locked(self):
+        size = self.screen.getmaxyx()
+        if size != self._terminal_size:
+            self._terminal_size = size
+            curses.update_lines_cols()
+        self.screen.clear()
+        self.screen.noutrefresh()
+        self._init_draw_areas()
+        self._terminal_frame = None
+
+    def _init_ansi(self):
+        self._ansi = AnsiTerminal()
 
     def _cleanup(self):
+        if self._output_process is not None:
+            self._output_process.stop()
+            self._output_process = None
+        if self._render_thread is not None:
+            self._render_thread.stop()
+            self._render_thread = None
+        if self._ansi is not None:
+            self._ansi.cleanup()
+            self._ansi = None
         # Clean up memory used by the library when not needed anymore.
         if self._leds is not None:
             ws.ws2811_fini(self._leds)
             ws.delete_ws2811_t(self._leds)
             self._leds = None
             self._channel = None
+            self._led_buffer = None
 
     def _begin(self):
         """Initialize library, must be called once before other functions are
@@ -136,89 +280,259 @@ class Screen:
             str_resp = ws.ws2811_get_return_t_str(resp)
             raise RuntimeError('ws2811_init failed with code {0} ({1})'.format(resp, str_resp))
 
+    def mark_input(self, timestamp: float) -> None:
+        """Note that the next rendered frame shows an input acquired at
+        `timestamp` (time.monotonic). Once that frame got pushed to the outputs
+        the time since the oldest marked input is added to the latencies.
+        """
+        if self._input_time is None or timestamp < self._input_time:
+            self._input_time = timestamp
+
+    def latency_stats(self) -> LatencyStats:
+        """Percentiles of the input to photon latency in seconds."""
+        return self.latency.stats()
+
     def render(self):
-        game_area = self._render_game_area()
+        input_time, self._input_time = self._input_time, None
+        if self._output_process is not None:
+            shared_frame = self._output_process.frame
+            start = metrics.begin()
+            self._render_game_area()
+            metrics.end('compose', start)
+            shared_frame.begin_write()
+            np.copyto(shared_frame.frame, self.frame)
+            shared_frame.set_input_time(input_time)
+            shared_frame.end_write()
+            metrics.count('frames')
+            self._output_process.notify()
+            if self.headless is not None:
+                self.headless.push(self.frame)
+            if self.recorder is not None:
+                self.recorder.record_frame(self.frame, self.input_sequence)
+            return
+        start = metrics.begin()
+        self._render_game_area()
+        metrics.end('compose', start)
+        metrics.count('frames')
+        if self.recorder is not None:
+            self.recorder.record_frame(self.frame, self.input_sequence)
+        if self._render_thread is None:
+            self._push(self.frame, input_time)
+        else:
+            self._render_thread.submit(self.frame, input_time)
+
+    def render_stats(self) -> RenderStats:
+        if self._render_thread is None:
+            return RenderStats(0, 0, 0., 0.)
+        return self._render_thread.stats()
+
+    def _push(self, frame, input_time: None | float = None) -> None:
+        if self.headless is not None:
+            self.headless.push(frame)
         if self.use_leds:
-            self._render_leds(game_area)
-        if self.use_terminal:
-            self._render_terminal(game_area)
+            start = metrics.begin()
+            led_frame = self._led_correction.apply(frame)
+            metrics.end('correction', start)
+            self._render_leds(led_frame)
+        if self.use_terminal or self.use_ansi:
+            start = metrics.begin()
+            display_frame = self._display_correction.apply(frame)
+            metrics.end('correction', start)
+            if self.use_terminal:
+                start = metrics.begin()
+                self._render_terminal(display_frame)
+                metrics.end('terminal', start)
+            if self.use_ansi:
+                start = metrics.begin()
+                self._ansi.render(display_frame)
+                metrics.end('ansi', start)
+        if input_time is not None:
+            latency = time.monotonic() - input_time
+            self.latency.add(latency)
+            metrics.observe('input_to_photon', latency)
 
     def _render_game_area(self):
+        """Compose the layers into the game area of the frame."""
+        if self.marquee is not None:
+            self.cur_text_mask = self.marquee.advance()
+        if self.cur_text_mask is not self._text_layer_source:
+            self._update_text_layer()
+        return self.compositor.compose()
+
+    def _update_text_layer(self):
+        self._text_layer_source = self.cur_text_mask
         if self.cur_text_mask is None:
-            return self.game_area_pixel
-        text_width = self.cur_text_mask.shape[1]
-        width = min(WIDTH, text_width)
-        frame_mask = self.cur_text_mask[:,:width]
-        result = np.array(self.game_area_pixel, copy=True)
-        np.putmask(result, frame_mask, 0xffffff)
-        return result
-
-    def _render_leds(self, game_area) -> None:
-        it = np.nditer(game_area, flags=['c_index'])
-        for color in it:
-            self[it.index + NUM_PIXELS_POINTS] = int(color)
+            self._text_layer.visible = False
+            return
+        mask = self.cur_text_mask[:, :WIDTH]
+        if self._text_layer.pixels.shape != mask.shape:
+            self._text_layer.resize(*mask.shape, TEXT_COLOR)
+        self._text_layer.mask = mask
+        self._text_layer.visible = True
+
+    def add_layer(self, height: int, width: int, z: int = SPRITE_Z, offset: tuple[int, int] = (0, 0)) -> Layer:
+        """Add a layer to the game area, e.g. for a sprite that moves on top
+        of the background without repainting it.
+        """
+        return self.compositor.add_layer(Layer(height, width, z, offset))
+
+    def remove_layer(self, layer: Layer):
+        self.compositor.remove_layer(layer)
+
+    def _render_leds(self, frame) -> None:
         """Update the display with the data from the LED buffer."""
+        start = metrics.begin()
+        # the point area leds expect their colors in GRB order
+        self._led_buffer[:NUM_PIXELS_POINTS] = rgb_to_grb(frame[:NUM_PIXELS_POINTS])
+        self._led_buffer[self._led_index_map] = frame[NUM_PIXELS_POINTS:].reshape((HEIGHT, WIDTH))
+        metrics.end('led_upload', start)
+        start = metrics.begin()
         resp = ws.ws2811_render(self._leds)
+        metrics.end('led_render', start)
         if resp != 0:
             str_resp = ws.ws2811_get_return_t_str(resp)
             raise RuntimeError('ws2811_render failed with code {0} ({1})'.format(resp, str_resp))
 
-    def _render_terminal(self, game_area) -> None:
-        self.screen.clear()
-        it = np.nditer(game_area, flags=['multi_index'])
-        for color in it:
-            color_index = find_closest_color_index(color)
-            y, x = it.multi_index
-            self.game_area.addch(y + 1, x * 2 + 2, curses.ACS_BLOCK, curses.color_pair(color_index))
-        self.game_area.refresh()
-        self.points_a_area.refresh()
-        self.points_b_area.refresh()
-
-    def get_brightness(self):
-        return ws.ws2811_channel_t_brightness_get(self._channel)
+    def _render_terminal(self, frame) -> None:
+        with self._terminal_lock:
+            self._render_terminal_locked(frame)
+
+    def _render_terminal_locked(self, frame) -> None:
+        if self.screen.getmaxyx() != self._terminal_size:
+            self._redraw_terminal_locked()
+        color_indices = colors_to_palette_indices(frame)
+        if self._terminal_frame is None:
+            changed = np.arange(len(color_indices))
+        else:
+            changed = np.flatnonzero(color_indices != self._terminal_frame)
+        for index in changed:
+            window, y, x = self._terminal_cells[index]
+            self._terminal_windows[window].addch(y, x, curses.ACS_BLOCK, palette_color_pair(color_indices[index]))
+        self._terminal_frame = color_indices
+        # collect all window changes and push them to the terminal at once
+        self.game_area.noutrefresh()
+        self.points_a_area.noutrefresh()
+        self.points_b_area.noutrefresh()
+        curses.doupdate()
+
+    def get_brightness(self) -> None | int:
+        """The brightness set last, None if none was set yet."""
+        return self.brightness
 
     def set_brightness(self, brightness):
         """Scale each LED in the buffer by the provided brightness.  A brightness
         of 0 is the darkest and 255 is the brightest.
         """
-        ws.ws2811_channel_t_brightness_set(self._channel, brightness)
+        self.brightness = min(max(int(brightness), 0), MAX_BRIGHTNESS)
+        if self._output_process is not None:
+            self._output_process.frame.brightness[0] = self.brightness
+        self._led_correction.set_brightness(self.brightness)
+        self._display_correction.set_brightness(self.brightness)
 
     def set_game_area_pixel(self, x: int, y: int, color: int):
         self.game_area_pixel[y][x] = color
+        self.background.mark_dirty()
 
     def set_point_area_pixel(self, set_b_area: bool, pos: int, color: int):
-        if self.use_leds:
-            pos_led = pos
-            if set_b_area:
-                pos_led += 5
-            self[pos_led] = rgb_to_grb(color)
-        if self.use_terminal:
-            color_index = find_closest_color_index(color)
-            point_area = self.points_b_area if set_b_area else self.points_a_area
-            point_area.addch(pos + 1, 2, curses.ACS_BLOCK, curses.color_pair(color_index))
+        self.frame_points[int(set_b_area), pos] = color
 
     def fill_game_area(self, color: int):
         self.game_area_pixel.fill(color)
+        self.background.mark_dirty()
 
     def fill_point_area(self, set_b_area: bool, color: int):
-        if self.use_leds:
-            color_points_leds = rgb_to_grb(color)
-            positions = range(5, 10) if set_b_area else range(0, 5)
-            for pos in positions:
-                self[pos] = color_points_leds
-        if self.use_terminal:
-            color_index = find_closest_color_index(color)
-            point_area = self.points_b_area if set_b_area else self.points_a_area
-            for pos in range(1, 6):
-                point_area.addch(pos, 2, curses.ACS_BLOCK, curses.color_pair(color_index))
+        self.frame_points[int(set_b_area)] = color
+
+    def set_game_area(self, colors: np.ndarray):
+        """Set the whole game area from a (HEIGHT, WIDTH) array of colors."""
+        np.copyto(self.game_area_pixel, colors)
+        self.background.mark_dirty()
+
+    def set_point_area(self, set_b_area: bool, colors: np.ndarray):
+        np.copyto(self.frame_points[int(set_b_area)], colors)
 
-    def set_text(self, text: Union[str, None]):
+    def set_text(self, text: Union[str, None], kerning: int = 1,
+                 vertical_alignment: VerticalAlignment = VerticalAlignment.center):
+        self.marquee = None
         if text is None:
             self.cur_text_mask = None
-        glyphs = np.copy(GLYPHS[text[0]])
-        kerning_space = np.full((7, 1), False)
-        for char in text[1:]:
-            glyphs = np.concatenate((glyphs, kerning_space, GLYPHS[char]), axis=1)
-        # TODO: for now we add two rows empty rows to have the same height as the play area
-        line = np.full((2, glyphs.shape[1]), False)
-        self.cur_text_mask = np.concatenate((line, glyphs, line), axis=0)
+            return
+        self.cur_text_mask = compile_text(text, kerning, vertical_alignment)
+
+    def set_marquee(self, text: Union[str, None], columns_per_frame: float = 1.,
+                    columns_per_second: None | float = None, wrap: bool = True, gap: int = MARQUEE_GAP,
+                    kerning: int = 1, vertical_alignment: VerticalAlignment = VerticalAlignment.center):
+        """Scroll `text` through the game area, advancing by `columns_per_frame`
+        on every render or, if given, by `columns_per_second`.
+        """
+        self.set_text(None)
+        if text is None:
+            return
+        mask = compile_text(text, kerning, vertical_alignment)
+        self.marquee = Marquee(mask, columns_per_frame, columns_per_second, wrap, gap)
+        self.cur_text_mask = self.marquee.window()
+
+    class RenderThread(threading.Thread):
+        """Pushes frames to the outputs in the background. Only the latest
+        submitted frame gets pushed; frames submitted while the thread is still
+        busy replace each other and are counted as dropped.
+        """
+
+        def __init__(self, parent):
+            threading.Thread.__init__(self, name='ScreenRenderer', daemon=True)
+            self.parent = parent
+            self.front = np.zeros(TOTAL_AMOUNT_LEDS, np.int32)
+            self.back = np.zeros(TOTAL_AMOUNT_LEDS, np.int32)
+            self.back_input_time: None | float = None
+            self.condition = threading.Condition()
+            self.pending = False
+            self.running = True
+            self.error: None | Exception = None
+            self.frames_pushed = 0
+            self.frames_dropped = 0
+            self.push_time_last = 0.
+            self.push_time_total = 0.
+
+        def submit(self, frame, input_time: None | float = None) -> None:
+            if self.error is not None:
+                raise self.error
+            with self.condition:
+                np.copyto(self.back, frame)
+                if self.pending:
+                    self.frames_dropped += 1
+                    metrics.count('frames_dropped')
+                    # the dropped frame's inputs are shown by this one
+                    if self.back_input_time is not None and (input_time is None or self.back_input_time < input_time):
+                        input_time = self.back_input_time
+                self.back_input_time = input_time
+                self.pending = True
+                self.condition.notify()
+
+        def run(self):
+            while True:
+                with self.condition:
+                    while self.running and not self.pending:
+                        self.condition.wait()
+                    if not self.running:
+                        return
+                    self.front, self.back = self.back, self.front
+                    input_time, self.back_input_time = self.back_input_time, None
+                    self.pending = False
+                start = time.perf_counter()
+                try:
+                    self.parent._push(self.front, input_time)
+                except Exception as error:
+                    self.error = error
+                    return
+                self.push_time_last = time.perf_counter() - start
+                self.push_time_total += self.push_time_last
+                self.frames_pushed += 1
+
+        def stop(self):
+            with self.condition:
+                self.running = False
+                self.condition.notify()
+            self.join()
+
+        def stats(self) -> RenderStats:
+            return RenderStats(self.frames_pushed, self.frames_dropped, self.push_time_last, self.push_time_total)
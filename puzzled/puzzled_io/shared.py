@@ -0,0 +1,232 @@
+import itertools
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from .const import TOTAL_AMOUNT_LEDS
+from .latency import LATENCY_WINDOW, LatencyTracker
+from .metrics import metrics
+
+
+SEQUENCE_SIZE = np.dtype(np.uint64).itemsize
+FRAME_SIZE = TOTAL_AMOUNT_LEDS * np.dtype(np.int32).itemsize
+# brightness, padded so the following float64 values stay aligned
+BRIGHTNESS_SIZE = 8
+# brightness of the shared frame while the game did not set one
+BRIGHTNESS_UNSET = -1
+# input time, consumed sequence and latency count
+LATENCY_HEADER_SIZE = 3 * 8
+LATENCIES_SIZE = LATENCY_WINDOW * np.dtype(np.float64).itemsize
+SHARED_FRAME_SIZE = SEQUENCE_SIZE + FRAME_SIZE + BRIGHTNESS_SIZE + LATENCY_HEADER_SIZE + LATENCIES_SIZE
+# how long the output process waits for a new frame before checking for stop
+FRAME_WAIT_TIMEOUT = 0.1
+# how long a metrics snapshot of the output process is waited for, longer than FRAME_WAIT_TIMEOUT
+METRICS_REPLY_TIMEOUT = 0.5
+
+
+class SharedFrame:
+    """A frame living in shared memory, so another process can push it to the
+    outputs. Writes are guarded by a sequence counter (seqlock): it is odd
+    while a frame is written, readers retry until they saw a stable even value.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        create = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=create, size=SHARED_FRAME_SIZE)
+        self.name = self.memory.name
+        self.owner = create
+        buffer = self.memory.buf
+        self.sequence = np.ndarray((1,), np.uint64, buffer=buffer)
+        self.frame = np.ndarray((TOTAL_AMOUNT_LEDS,), np.int32, buffer=buffer, offset=SEQUENCE_SIZE)
+        # set by the game process, applied by the outputs, BRIGHTNESS_UNSET until the game set one
+        self.brightness = np.ndarray((1,), np.int32, buffer=buffer, offset=SEQUENCE_SIZE + FRAME_SIZE)
+        offset = SEQUENCE_SIZE + FRAME_SIZE + BRIGHTNESS_SIZE
+        # oldest input not yet taken by the output process, 0 for none
+        self.input_time = np.ndarray((1,), np.float64, buffer=buffer, offset=offset)
+        # written by the output process: sequence of the frame it took last
+        self.consumed = np.ndarray((1,), np.uint64, buffer=buffer, offset=offset + 8)
+        # latency window filled by the output process, see LatencyTracker
+        self.latency_count = np.ndarray((1,), np.uint64, buffer=buffer, offset=offset + 16)
+        self.latencies = np.ndarray((LATENCY_WINDOW,), np.float64, buffer=buffer, offset=offset + 24)
+        if create:
+            self.sequence[0] = 0
+            self.frame.fill(0)
+            self.brightness[0] = BRIGHTNESS_UNSET
+            self.input_time[0] = 0.
+            self.consumed[0] = 0
+            self.latency_count[0] = 0
+            self.latencies.fill(0.)
+
+    def begin_write(self) -> None:
+        self.sequence[0] += 1
+
+    def end_write(self) -> None:
+        self.sequence[0] += 1
+
+    def set_input_time(self, input_time: None | float) -> None:
+        """Attach the oldest input shown by the frame being written. While the
+        output process did not take the previous frame yet, its input is kept,
+        so skipped frames do not lose their inputs.
+        """
+        pending = float(self.input_time[0])
+        if int(self.consumed[0]) == int(self.sequence[0]) - 1:
+            pending = 0.
+        if input_time is not None and (not pending or input_time < pending):
+            pending = input_time
+        self.input_time[0] = pending
+
+    def read(self, frame: np.ndarray) -> tuple[int, None | float]:
+        """Copy a consistent frame into the given array and return its
+        sequence and the time of the oldest input it shows.
+        """
+        while True:
+            before = int(self.sequence[0])
+            if before & 1:
+                time.sleep(0)
+                continue
+            np.copyto(frame, self.frame)
+            input_time = float(self.input_time[0])
+            if int(self.sequence[0]) == before:
+                self.consumed[0] = before
+                return before, input_time or None
+
+    def close(self) -> None:
+        # views have to be released before the memory can be closed
+        self.sequence = self.frame = self.brightness = None
+        self.input_time = self.consumed = self.latency_count = self.latencies = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class OutputProcess:
+    """Runs the LED and terminal outputs in their own process, fed through a
+    SharedFrame. That way they do not compete with the game and the input
+    threads for the GIL.
+
+    The metrics of the output stages are taken in the output process, they
+    are requested through a pipe whenever the metrics of this process are
+    snapshot.
+    """
+
+    def __init__(self, use_leds: bool, use_terminal: bool, use_ansi: bool):
+        self.frame = SharedFrame()
+        context = multiprocessing.get_context('spawn')
+        self.frame_ready = context.Event()
+        self.stop_requested = context.Event()
+        self.redraw_requested = context.Event()
+        self._metrics_connection, metrics_connection = context.Pipe()
+        self._metrics_requests = itertools.count()
+        # the exporter thread requests snapshots while the game thread may stop the process
+        self._metrics_lock = threading.Lock()
+        self.process = context.Process(
+            target=run_output_process,
+            name='ScreenOutput',
+            args=(self.frame.name, self.frame_ready, self.stop_requested, self.redraw_requested, metrics_connection,
+                  metrics.enabled, use_leds, use_terminal, use_ansi),
+            daemon=True,
+        )
+        self.process.start()
+        metrics_connection.close()
+        metrics.add_source(self.metrics_snapshot)
+
+    def notify(self) -> None:
+        self.frame_ready.set()
+
+    def request_redraw(self) -> None:
+        """Redraw the terminal completely with the next frame."""
+        self.redraw_requested.set()
+
+    def metrics_snapshot(self) -> None | dict:
+        """Metrics of the output process, None if it did not answer in time.
+        The output process is enabled or disabled like the metrics of this one.
+        """
+        with self._metrics_lock:
+            if self._metrics_connection is None:
+                return None
+            request = next(self._metrics_requests)
+            try:
+                self._metrics_connection.send((request, metrics.enabled))
+                while self._metrics_connection.poll(METRICS_REPLY_TIMEOUT):
+                    answered, snapshot = self._metrics_connection.recv()
+                    # late answers to earlier requests are skipped
+                    if answered == request:
+                        return snapshot
+            except (EOFError, OSError):
+                # the output process is gone
+                pass
+            return None
+
+    def stop(self) -> None:
+        metrics.remove_source(self.metrics_snapshot)
+        with self._metrics_lock:
+            if self._metrics_connection is not None:
+                self._metrics_connection.close()
+                self._metrics_connection = None
+        self.stop_requested.set()
+        self.frame_ready.set()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.frame.close()
+
+
+def answer_metrics_requests(connection) -> None:
+    while connection.poll():
+        try:
+            request, enabled = connection.recv()
+        except EOFError:
+            # the game process is stopping this one
+            return
+        if enabled:
+            metrics.enable()
+        else:
+            metrics.disable()
+        connection.send((request, metrics.snapshot()))
+
+
+def run_output_process(name: str, frame_ready, stop_requested, redraw_requested, metrics_connection,
+                       metrics_enabled: bool, use_leds: bool, use_terminal: bool, use_ansi: bool):
+    # imported here as the screen itself uses this module
+    from .screen import Screen
+
+    frame = SharedFrame(name)
+    screen = Screen(use_leds, use_terminal, use_ansi)
+    # latencies go to shared memory, where the game process reads them
+    screen.latency = LatencyTracker(frame.latencies, frame.latency_count)
+    if metrics_enabled:
+        metrics.enable()
+    last_sequence = -1
+    last_input_time = 0.
+    try:
+        while not stop_requested.is_set():
+            answer_metrics_requests(metrics_connection)
+            if not frame_ready.wait(FRAME_WAIT_TIMEOUT):
+                continue
+            frame_ready.clear()
+            sequence, input_time = frame.read(screen.frame)
+            if sequence == last_sequence:
+                continue
+            last_sequence = sequence
+            # an input taken with an earlier frame can show up again, when the
+            # game process wrote before it saw this process take that frame
+            if input_time is not None and input_time <= last_input_time:
+                input_time = None
+            elif input_time is not None:
+                last_input_time = input_time
+            # the outputs keep their own defaults until the game set a brightness
+            brightness = int(frame.brightness[0])
+            if brightness != BRIGHTNESS_UNSET and brightness != screen.brightness:
+                screen.set_brightness(brightness)
+            if redraw_requested.is_set():
+                redraw_requested.clear()
+                screen.redraw_terminal()
+            # already composed by the game process, only push it to the outputs
+            screen._push(screen.frame, input_time)
+    finally:
+        metrics_connection.close()
+        frame.close()
@@ -0,0 +1,289 @@
+"""Simulated hardware standing in for spidev, RPi.GPIO and rpi_ws281x, so the
+hardware code paths of the input and the screen run on any machine.
+
+install() has to be called before puzzled_io.input and puzzled_io.screen are
+imported, as those decide at import time whether the hardware is available.
+Everything is deterministic: the ADC runs on a virtual clock advanced by every
+conversion and all randomness comes from seeded generators.
+"""
+import collections
+import ctypes
+import importlib.machinery
+import importlib.util
+import math
+import random
+import sys
+import time
+import types
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+ADC_MAX_VALUE = 4095
+# conversions per second of the simulated ADC
+ADC_SAMPLE_RATE = 100_000
+# amount of rendered frames the simulated LED controller keeps
+LED_HISTORY = 1024
+# modules deciding at import time whether the hardware is available, with
+# puzzled/ on the path or imported through the repository root
+HARDWARE_DEPENDENT_MODULES = tuple(f'{package}.{module}' for package in ('puzzled_io', 'puzzled.puzzled_io')
+                                   for module in ('input', 'screen'))
+
+# maps the time in seconds to a raw ADC value
+Waveform = Callable[[float], float]
+
+
+def constant(value: float) -> Waveform:
+    return lambda t: value
+
+
+def ramp(start: float, end: float, duration: float) -> Waveform:
+    """Linear from start to end within duration, then stays at end."""
+    return lambda t: start + (end - start) * min(t / duration, 1.)
+
+
+def sine(center: float, amplitude: float, period: float) -> Waveform:
+    return lambda t: center + amplitude * math.sin(2 * math.pi * t / period)
+
+
+def steps(values: Sequence[float], duration: float) -> Waveform:
+    """Holds every value for duration seconds, the last one forever."""
+    return lambda t: values[min(int(t / duration), len(values) - 1)]
+
+
+def replay(times: Sequence[float], values: Sequence[float]) -> Waveform:
+    """Linear interpolation of recorded (time, value) samples."""
+    return lambda t: float(np.interp(t, times, values))
+
+
+class SimulatedAdc:
+    """MCP3208 on the SPI bus, answering every conversion with the value of
+    the waveform of the requested channel, plus optional gaussian noise.
+    """
+
+    def __init__(self, waveforms: Optional[dict[int, Waveform]] = None, sample_rate: float = ADC_SAMPLE_RATE,
+                 noise: float = 0., seed: int = 0):
+        self.waveforms = dict(waveforms or {})
+        self.sample_rate = sample_rate
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.conversions = 0
+        self.is_open = False
+        self.max_speed_hz = 0
+        self.bits_per_word = 8
+        self.mode = 0
+
+    @property
+    def time(self) -> float:
+        """Virtual time of the next conversion in seconds."""
+        return self.conversions / self.sample_rate
+
+    def open(self, bus: int, device: int) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+
+    def sample(self, channel: int) -> int:
+        waveform = self.waveforms.get(channel)
+        value = 0. if waveform is None else waveform(self.time)
+        if self.noise:
+            value += self.random.gauss(0., self.noise)
+        self.conversions += 1
+        return min(max(round(value), 0), ADC_MAX_VALUE)
+
+    def xfer2(self, command: list[int]) -> list[int]:
+        # start bit, single ended and the channel spread over the first two bytes
+        channel = ((command[0] & 1) << 2) | (command[1] >> 6)
+        value = self.sample(channel)
+        return [0, (value >> 8) & 0x0F, value & 0xFF]
+
+
+class SimulatedGpio:
+    """Input pins with edge detection. Level changes are generated with a
+    configurable amount of contact bounce, edge callbacks are called right
+    away from the thread changing the level.
+    """
+
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, max_bounces: int = 0, seed: int = 0):
+        self.max_bounces = max_bounces
+        self.random = random.Random(seed)
+        self.mode: None | int = None
+        self.levels: dict[int, int] = {}
+        self.detectors: dict[int, tuple[int, Callable[[int], None]]] = {}
+        self.edges = 0
+
+    def setmode(self, mode: int) -> None:
+        self.mode = mode
+
+    def setup(self, channel: int, direction: int, pull_up_down: int = PUD_OFF) -> None:
+        self.levels[channel] = 1 if pull_up_down == self.PUD_UP else 0
+
+    def add_event_detect(self, channel: int, edge: int, callback: Callable[[int], None] = None,
+                         bouncetime: None | int = None) -> None:
+        self.detectors[channel] = (edge, callback)
+
+    def remove_event_detect(self, channel: int) -> None:
+        self.detectors.pop(channel, None)
+
+    def input(self, channel: int) -> int:
+        return self.levels.get(channel, 0)
+
+    def cleanup(self, channel: None | int = None) -> None:
+        if channel is None:
+            self.levels.clear()
+            self.detectors.clear()
+        else:
+            self.levels.pop(channel, None)
+            self.detectors.pop(channel, None)
+
+    def _edge(self, channel: int, level: int) -> None:
+        self.levels[channel] = level
+        self.edges += 1
+        edge, callback = self.detectors.get(channel, (None, None))
+        if callback is None:
+            return
+        if edge == self.BOTH or edge == (self.RISING if level else self.FALLING):
+            callback(channel)
+
+    def set_level(self, channel: int, level: int, bounces: None | int = None) -> None:
+        """Change the level of a pin, bouncing a few times before it settles."""
+        if bounces is None:
+            bounces = self.random.randint(0, self.max_bounces)
+        for _ in range(bounces):
+            self._edge(channel, level)
+            self._edge(channel, 1 - level)
+        self._edge(channel, level)
+
+    def press(self, channel: int, bounces: None | int = None) -> None:
+        self.set_level(channel, 1, bounces)
+
+    def release(self, channel: int, bounces: None | int = None) -> None:
+        self.set_level(channel, 0, bounces)
+
+
+class SimulatedLedChannel:
+    def __init__(self):
+        self.count = 0
+        self.gpionum = 0
+        self.invert = 0
+        self.brightness = 0
+        self.strip_type = 0
+        self.leds = (ctypes.c_uint32 * 0)()
+
+    def set_count(self, count: int) -> None:
+        self.count = count
+        self.leds = (ctypes.c_uint32 * count)()
+
+
+class SimulatedLedController:
+    """ws2811_t recording every rendered frame of channel 0 together with the
+    monotonic time the render was called at.
+    """
+
+    def __init__(self, history: int = LED_HISTORY):
+        self.channels = [SimulatedLedChannel(), SimulatedLedChannel()]
+        self.freq = 0
+        self.dmanum = 0
+        self.frames: collections.deque[tuple[float, npt.NDArray[np.uint32]]] = collections.deque(maxlen=history)
+        self.render_count = 0
+
+    def render(self) -> int:
+        leds = self.channels[0].leds
+        self.frames.append((time.monotonic(), np.frombuffer(leds, np.uint32).copy()))
+        self.render_count += 1
+        return 0
+
+
+def _module(name: str, attributes: dict) -> types.ModuleType:
+    # a spec is needed, find_spec is used to check for the hardware modules
+    module = importlib.util.module_from_spec(importlib.machinery.ModuleSpec(name, None))
+    module.__dict__.update(attributes)
+    return module
+
+
+def _setter(attribute: str) -> Callable:
+    return lambda target, value: setattr(target, attribute, value)
+
+
+def _getter(attribute: str) -> Callable:
+    return lambda target: getattr(target, attribute)
+
+
+def _led_set(channel: SimulatedLedChannel, pos: int, value: int) -> int:
+    channel.leds[pos] = value
+    return 0
+
+
+class SimulatedHardware:
+    """Devices behind the simulated modules, created by install()."""
+
+    def __init__(self, adc: SimulatedAdc, gpio: SimulatedGpio, leds: SimulatedLedController):
+        self.adc = adc
+        self.gpio = gpio
+        self.leds = leds
+
+    def spidev_module(self) -> types.ModuleType:
+        # every SpiDev opened is the same simulated ADC
+        return _module('spidev', {'SpiDev': lambda: self.adc})
+
+    def gpio_module(self) -> types.ModuleType:
+        gpio = self.gpio
+        attributes = {name: getattr(gpio, name) for name in (
+            'BOARD', 'BCM', 'OUT', 'IN', 'PUD_OFF', 'PUD_DOWN', 'PUD_UP', 'RISING', 'FALLING', 'BOTH',
+            'setmode', 'setup', 'add_event_detect', 'remove_event_detect', 'input', 'cleanup',
+        )}
+        return _module('RPi.GPIO', attributes)
+
+    def ws281x_module(self) -> types.ModuleType:
+        leds = self.leds
+        return _module('rpi_ws281x', {
+            'WS2811_STRIP_GRB': 0x00081000,
+            'new_ws2811_t': lambda: leds,
+            'delete_ws2811_t': lambda controller: None,
+            'ws2811_t_freq_set': _setter('freq'),
+            'ws2811_t_dmanum_set': _setter('dmanum'),
+            'ws2811_channel_get': lambda controller, number: controller.channels[number],
+            'ws2811_channel_t_count_set': SimulatedLedChannel.set_count,
+            'ws2811_channel_t_count_get': _getter('count'),
+            'ws2811_channel_t_gpionum_set': _setter('gpionum'),
+            'ws2811_channel_t_invert_set': _setter('invert'),
+            'ws2811_channel_t_strip_type_set': _setter('strip_type'),
+            'ws2811_channel_t_brightness_set': _setter('brightness'),
+            'ws2811_channel_t_brightness_get': _getter('brightness'),
+            'ws2811_channel_t_leds_get': lambda channel: ctypes.addressof(channel.leds),
+            'ws2811_init': lambda controller: 0,
+            'ws2811_render': SimulatedLedController.render,
+            'ws2811_fini': lambda controller: None,
+            'ws2811_get_return_t_str': lambda code: f'simulated error {code}',
+            'ws2811_led_get': lambda channel, pos: channel.leds[pos],
+            'ws2811_led_set': _led_set,
+        })
+
+
+def install(adc: Optional[SimulatedAdc] = None, gpio: Optional[SimulatedGpio] = None,
+            leds: Optional[SimulatedLedController] = None) -> SimulatedHardware:
+    """Put the simulated modules into sys.modules, replacing the real ones."""
+    if any(module in sys.modules for module in HARDWARE_DEPENDENT_MODULES):
+        raise RuntimeError('the simulation has to be installed before the input and the screen are imported')
+    hardware = SimulatedHardware(adc or SimulatedAdc(), gpio or SimulatedGpio(), leds or SimulatedLedController())
+    gpio_module = hardware.gpio_module()
+    sys.modules.update({
+        'spidev': hardware.spidev_module(),
+        'RPi': _module('RPi', {'GPIO': gpio_module}),
+        'RPi.GPIO': gpio_module,
+        'rpi_ws281x': hardware.ws281x_module(),
+    })
+    return hardware
@@ -0,0 +1,36 @@
+"""Replays a recorded session through the game and checks that every frame
+comes out the same as recorded.
+
+    python puzzled/replay.py SESSION [--fast]
+"""
+import argparse
+import sys
+
+from puzzled_io.input import Input
+from puzzled_io.recording import SessionReader, replay
+from puzzled_io.screen import Screen
+
+from puzzled import Game
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('session', help='session log written by puzzled.py --record')
+    parser.add_argument('--fast', action='store_true', help='replay as fast as possible instead of in real time')
+    args = parser.parse_args()
+
+    reader = SessionReader(args.session)
+    screen = Screen(False, use_headless=True)
+    # the recorded inputs take the place of the input devices
+    inputer = Input(use_headless=True)
+    game = Game(screen, inputer)
+    result = replay(reader, inputer.record_change, game.step, None if args.fast else 1.)
+    reader.close()
+    print(f'{result.frames} frames, {result.mismatches} differ from the recording')
+    if result.mismatches:
+        print(f'first differing frame: {result.first_mismatch}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()